@@ -1,27 +1,64 @@
-from config import *
+import config
 
 # ----------------------------------------------------------------------------#
 # Imports
 # ----------------------------------------------------------------------------#
 
-import sys
+import click
+from functools import lru_cache, wraps
+from itertools import groupby
 import dateutil.parser
-import babel
+import babel.dates
 from flask import (
     Flask,
+    Response,
     render_template,
     request,
     flash,
     redirect,
-    url_for
+    url_for,
+    abort,
+    stream_with_context
 )
 from flask_moment import Moment
 from flask_migrate import Migrate
-from sqlalchemy.exc import SQLAlchemyError
-import logging
-from logging import Formatter, FileHandler
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from forms import *
 from models import *
+from pagination import keyset_paginate, InvalidCursor
+from search import SearchEngine
+from matching import Matcher
+from cache import Cache
+from importer import IMPORT_KINDS, read_rows, import_rows
+from exporter import EXPORT_FORMATS, parse_export_filters, export
+from pooling import pool_stats
+from metrics import RequestMetrics
+from logs import init_logging
+from templating import init_templates, precompile_templates
+from assets import init_assets, build as build_assets
+from images import ImageProxy
+from counters import roll, recount
+from geo import nearby, load_gazetteer, geocode
+from routing import configure_replicas, init_replicas
+from deletion import delete_entities
+from updates import (
+    FORMS,
+    InvalidChanges,
+    changed_values,
+    clean_changes,
+    apply_updates
+)
+from scheduling import (
+    EXCLUSION_VIOLATION,
+    find_conflicts,
+    conflict_messages
+)
+from facets import (
+    parse_facets,
+    facet_filters,
+    facet_counts,
+    count_result_facets
+)
 
 # ----------------------------------------------------------------------------#
 # App Config.
@@ -29,30 +66,181 @@ from models import *
 
 app = Flask(__name__)
 moment = Moment(app)
-app.config.from_object('config')
+app.config.from_object(config.get_config())
 app.url_map.strict_slashes = False
+configure_replicas(app)
 db.init_app(app)
+replicas = init_replicas(app, db)
 migrate = Migrate(app, db)
+init_logging(app)
+# The import command bumps the 'indexes' generation so that workers
+# rebuild their in-memory search and match indexes.
+search_engine = SearchEngine(db, app,
+                             generation=lambda: cache.generation('indexes'))
+matcher = Matcher(db, app, generation=lambda: cache.generation('indexes'))
+cache = Cache(app)
+fragments = init_templates(app)
+init_assets(app)
+images = ImageProxy(app)
+metrics = RequestMetrics(app)
+metrics.collect('fyyur_cache_hits_total', 'Cache lookups served from cache.',
+                lambda: cache.hits, kind='counter')
+metrics.collect('fyyur_cache_misses_total', 'Cache lookups that hit the '
+                'database.', lambda: cache.misses, kind='counter')
+metrics.collect('fyyur_fragment_cache_hits_total', 'Template fragments '
+                'served from cache.', lambda: fragments.hits, kind='counter')
+metrics.collect('fyyur_fragment_cache_misses_total', 'Template fragments '
+                'rendered.', lambda: fragments.misses, kind='counter')
+metrics.collect('fyyur_image_cache_bytes', 'Size of the image proxy cache.',
+                lambda: images.cache.size)
+metrics.collect('fyyur_db_replicas_healthy', 'Read replicas in use.',
+                replicas.healthy_count)
+metrics.collect('fyyur_db_pool_checked_out', 'Connections in use.',
+                lambda: pool_stats(db.engine).get('checked_out', 0))
+metrics.collect('fyyur_db_pool_saturation', 'Share of pool capacity in use.',
+                lambda: pool_stats(db.engine).get('saturation', 0))
+metrics.collect('fyyur_db_pool_wait_seconds_total', 'Time spent waiting '
+                'for a pooled connection.',
+                lambda: pool_stats(db.engine).get('wait_seconds_total', 0),
+                kind='counter')
+metrics.collect('fyyur_db_pool_timeouts_total', 'Connection checkouts that '
+                'timed out.', lambda: pool_stats(db.engine).get('timeouts', 0),
+                kind='counter')
 
 # ----------------------------------------------------------------------------#
 # Filters.
 # ----------------------------------------------------------------------------#
 
 
+DATETIME_LOCALE = babel.Locale.parse('en')
+DATETIME_PATTERNS = {
+    'full': babel.dates.parse_pattern("EEEE MMMM, d, y 'at' h:mma"),
+    'medium': babel.dates.parse_pattern("EE MM, dd, y h:mma"),
+}
+
+
+@lru_cache(maxsize=16384)
+def _format_datetime(value, format):
+    # Show pages repeat the same start times, so formatted strings are
+    # memoized; patterns are compiled once above or by babel's own cache.
+    pattern = DATETIME_PATTERNS.get(format) or \
+        babel.dates.parse_pattern(format)
+    return pattern.apply(value, DATETIME_LOCALE)
+
+
 def format_datetime(value, format='medium'):
-    date = -1
     if isinstance(value, str):
-        date = dateutil.parser.parse(value)
-    else:
-        date = value
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
+        value = dateutil.parser.parse(value)
+    return _format_datetime(value, format)
 
 
 app.jinja_env.filters['datetime'] = format_datetime
+precompile_templates(app)
+
+# ----------------------------------------------------------------------------#
+# Helpers.
+# ----------------------------------------------------------------------------#
+
+
+# Read-only views by endpoint; see read_view.
+READ_VIEWS = {}
+
+
+def read_view(rule, **options):
+    """Register a view that only reads and takes the session to read with
+    as its first argument. Served here with ``db.session``; asgi.py runs the
+    same views on async sessions."""
+    def decorator(view):
+        @wraps(view)
+        def sync_view(**view_args):
+            return view(db.session, **view_args)
+
+        READ_VIEWS[view.__name__] = view
+        app.route(rule, **options)(sync_view)
+        return view
+    return decorator
+
+
+def paginate(query, order_by, key):
+    try:
+        return keyset_paginate(query, order_by, key,
+                               after=request.args.get('after'),
+                               before=request.args.get('before'),
+                               per_page=app.config['PAGE_SIZE'])
+    except InvalidCursor:
+        abort(400)
+
+
+def entity_dict(entity):
+    return {column.name: getattr(entity, column.name)
+            for column in entity.__table__.columns}
+
+
+def detail_shows(rows, entity_name):
+    # Rows without a show come from the outer join and are skipped.
+    shows = []
+    for row in rows:
+        if row.start_time is not None:
+            show = row._asdict()
+            del show[entity_name]
+            shows.append(show)
+    return shows
+
+
+def partition_shows(shows):
+    # Split into upcoming and past shows against a single "now"; done on
+    # every request so cached show lists never go stale as time passes.
+    now = datetime.now()
+    upcoming_shows, past_shows = [], []
+    for show in shows:
+        if show['start_time'] >= now:
+            upcoming_shows.append(show)
+        else:
+            past_shows.append(show)
+    return upcoming_shows, past_shows
+
+
+def venue_cache_keys(venue_id):
+    # A venue's name and image also appear on the pages of every artist
+    # that has played there.
+    artist_ids = db.session.query(Show.artist_id) \
+        .filter(Show.venue_id == venue_id).distinct()
+    return [f'venue:{venue_id}'] + \
+        [f'artist:{artist_id}' for artist_id, in artist_ids]
+
+
+def artist_cache_keys(artist_id):
+    venue_ids = db.session.query(Show.venue_id) \
+        .filter(Show.artist_id == artist_id).distinct()
+    return [f'artist:{artist_id}'] + \
+        [f'venue:{venue_id}' for venue_id, in venue_ids]
+
+
+def invalidate(keys):
+    cache.delete(*keys)
+    cache.bump('shows')
+
+
+def listing_facet_counts(session, model, facets):
+    # Cached per facet selection; any venue (or artist) write bumps the
+    # generation and so drops every selection's counts at once.
+    key = 'facets:{}:{}:{}:{}:{}'.format(
+        model.__tablename__, cache.generation(model.__tablename__),
+        ','.join(sorted(facets['genre'])), facets['city'] or '',
+        facets['state'] or '')
+    return cache.get_or_set(key, lambda: facet_counts(session, model, facets))
+
+
+@app.template_global()
+def modify_query(**changes):
+    # Current URL with some query arguments replaced; None drops one.
+    args = request.values.to_dict(flat=False)
+    for name, value in changes.items():
+        if value is None:
+            args.pop(name, None)
+        else:
+            args[name] = value
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
 
 # ----------------------------------------------------------------------------#
 # Controllers.
@@ -67,47 +255,138 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
-def venues():
-    areas = Venue.query.distinct(Venue.city, Venue.state).all()
-    venues = Venue.query.all()
+@read_view('/venues')
+def venues(session):
+    facets = parse_facets(request.args)
+    # Upcoming show counts are stored on the venue rows; rows arrive sorted
+    # by area so grouping them is linear.
+    query = session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        Venue.version,
+        Venue.upcoming_shows_count
+    ).filter(*facet_filters(Venue, facets))
+    page = paginate(query,
+                    order_by=(Venue.city, Venue.state, Venue.id),
+                    key=lambda venue: (venue.city, venue.state, venue.id))
+
+    areas = [
+        {'city': city, 'state': state, 'venues': list(area_venues)}
+        for (city, state), area_venues
+        in groupby(page, key=lambda venue: (venue.city, venue.state))
+    ]
 
     return render_template('pages/venues.html',
                            areas=areas,
-                           venues=venues)
+                           page=page,
+                           facets=facets,
+                           facet_counts=listing_facet_counts(session, Venue,
+                                                             facets))
 
 
-@app.route('/venues/search', methods=['POST'])
-def search_venues():
-    search_term = request.form.get('search_term', '').strip()
-    response = Venue.query.filter(
-        Venue.name.ilike('%' + search_term + '%')).all()
+@read_view('/venues/search', methods=['GET', 'POST'])
+def search_venues(session):
+    search_term = request.values.get('search_term', '').strip()
+    facets = parse_facets(request.values)
+    response = search_engine.search(Venue, search_term,
+                                    facet_filters(Venue, facets), session)
 
     return render_template('pages/search_venues.html',
                            results=response,
-                           search_term=search_term)
-
-
-@app.route('/venues/<int:venue_id>')
-def show_venue(venue_id):
-    venue = Venue.query.get(venue_id)
-    shows = db.session.query(
-        Show.venue_id,
-        Artist.image_link,
-        Artist.id,
-        Artist.name,
-        Show.start_time,
-        Venue.name,
-        Venue.image_link,
-        ).join(Venue).join(Artist).filter(Show.venue_id == venue_id)
-    upcoming_shows = shows.filter(Show.start_time >= datetime.now()).all()
-    past_shows = shows.filter(Show.start_time < datetime.now()).all()
+                           search_term=search_term,
+                           facets=facets,
+                           facet_counts=count_result_facets(response))
+
+
+@read_view('/venues/nearby')
+def nearby_venues(session):
+    latitude = request.args.get('lat', type=float)
+    longitude = request.args.get('lng', type=float)
+    radius = request.args.get('radius', app.config['NEARBY_RADIUS_KM'],
+                              type=float)
+    limit = request.args.get('limit', app.config['NEARBY_LIMIT'], type=int)
+    # NaN fails every comparison, so it is refused too.
+    if None in (latitude, longitude) or not (
+            -90 <= latitude <= 90 and -180 <= longitude <= 180
+            and 0 < radius <= app.config['NEARBY_MAX_RADIUS_KM']
+            and 0 < limit <= app.config['NEARBY_MAX_LIMIT']):
+        return {'error': 'Expected "lat" and "lng" in degrees, and '
+                         'optionally a "radius" in km and a "limit" within '
+                         'the configured maximums.'}, 400
+
+    return {'venues': [{
+        'id': venue.id,
+        'name': venue.name,
+        'address': venue.address,
+        'city': venue.city,
+        'state': venue.state,
+        'latitude': venue.latitude,
+        'longitude': venue.longitude,
+        'distance_km': round(distance, 3),
+    } for distance, venue in nearby(session, latitude, longitude, radius,
+                                    limit)]}
+
+
+@read_view('/venues/<int:venue_id>')
+def show_venue(session, venue_id):
+    detail = cache.get_or_set(f'venue:{venue_id}',
+                              lambda: load_venue_detail(session, venue_id))
+    if detail is None:
+        abort(404)
+    upcoming_shows, past_shows = partition_shows(detail['shows'])
 
     return render_template('pages/show_venue.html',
-                           venue=venue,
+                           venue=detail['venue'],
                            upcoming_shows=upcoming_shows,
                            past_shows=past_shows)
 
+
+@read_view('/venues/<int:venue_id>/matches')
+def venue_matches(session, venue_id):
+    return entity_matches(session, Venue, venue_id)
+
+
+def entity_matches(session, model, entity_id):
+    # Artists seeking a venue for a venue, venues seeking talent for an
+    # artist; see matching.py.
+    limit = request.args.get('limit', app.config['MATCH_LIMIT'], type=int)
+    if not 0 < limit <= app.config['MATCH_MAX_LIMIT']:
+        return {'error': 'Expected a "limit" from 1 to '
+                         f'{app.config["MATCH_MAX_LIMIT"]}.'}, 400
+    matches = matcher.matches(session, model, entity_id, limit)
+    if matches is None:
+        abort(404)
+    kind = 'artists' if model is Venue else 'venues'
+    return {kind: [{
+        'id': match.id,
+        'name': match.name,
+        'city': match.city,
+        'state': match.state,
+        'genres': match.genres,
+        'image_link': match.image_link,
+        'score': round(score, 3),
+    } for match, score in matches]}
+
+
+def load_venue_detail(session, venue_id):
+    rows = session.query(
+        Venue,
+        Show.start_time,
+        Artist.id.label('artist_id'),
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')
+    ).outerjoin(Show, Show.venue_id == Venue.id) \
+        .outerjoin(Artist, Artist.id == Show.artist_id) \
+        .filter(Venue.id == venue_id) \
+        .order_by(Show.start_time).all()
+    if not rows:
+        return None
+
+    return {'venue': entity_dict(rows[0].Venue),
+            'shows': detail_shows(rows, 'Venue')}
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
@@ -130,11 +409,11 @@ def create_venue_submission():
             form.populate_obj(venue)
             db.session.add(venue)
             db.session.commit()
+            cache.bump('venues')
             flash('Venue \'' + venue_name + '\' was successfully listed!')
-        except SQLAlchemyError as e:
+        except SQLAlchemyError:
             db.session.rollback()
-            print(sys.exc_info())
-            print(str(e.orig))
+            app.logger.exception('Could not list venue %r', venue_name)
             flash(error_text)
         finally:
             db.session.close()
@@ -149,67 +428,145 @@ def create_venue_submission():
     return redirect(url_for('index'))
 
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@app.route('/venues/<int:venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
-    venue = Venue.query.get(venue_id)
-    error_text = f'Error occured: Venue \'{venue.name}\' could not be deleted.'
+    return delete_one(Venue, venue_id)
+
+
+@app.route('/venues/delete', methods=['POST'])
+def bulk_delete_venues():
+    return bulk_delete(Venue)
+
 
-    if venue is None:
-        redirect(url_for('not_found_error', error='Venue not found'))
+def delete_and_invalidate(model, ids):
+    """Delete venues or artists and all their shows in one transaction;
+    returns the deleted names by id."""
+    deleted = delete_entities(db.session, model, ids)
+    db.session.commit()
+    kind, related = ('venue', 'artist') if model is Venue \
+        else ('artist', 'venue')
+    for entity_id in deleted.names:
+        search_engine.discard(model, entity_id)
+        matcher.discard(model, entity_id)
+    cache.bump(model.__tablename__)
+    invalidate([f'{kind}:{entity_id}' for entity_id in deleted.names] +
+               [f'{related}:{entity_id}' for entity_id in deleted.related_ids])
+    return deleted.names
 
+
+def delete_one(model, entity_id):
+    label = model.__name__
     try:
-        db.session.delete(venue)
-        db.session.commit()
-        flash('Venue \'' + venue.name + '\' was successfully deleted!')
-    except SQLAlchemyError as e:
+        names = delete_and_invalidate(model, [entity_id])
+    except SQLAlchemyError:
         db.session.rollback()
-        print(sys.exc_info())
-        print(str(e.orig))
-        flash(error_text)
+        app.logger.exception('Could not delete %s %s', label.lower(),
+                             entity_id)
+        flash(f'Error occured: {label} {entity_id} could not be deleted.')
+        return redirect(url_for('index'))
     finally:
         db.session.close()
 
+    if not names:
+        abort(404)
+    flash(f'{label} \'{names[entity_id]}\' was successfully deleted!')
     return redirect(url_for('index'))
 
-#  Artists
-#  ----------------------------------------------------------------
 
+def bulk_delete(model):
+    # Expects {"ids": [...]}; ids that do not exist are reported as missing.
+    ids = (request.get_json(silent=True) or {}).get('ids')
+    if not isinstance(ids, list) or not all(
+            type(entity_id) is int for entity_id in ids):
+        return {'error': 'Expected a JSON object with a list of integer '
+                         '"ids".'}, 400
+    limit = app.config['BULK_DELETE_LIMIT']
+    if len(ids) > limit:
+        return {'error': f'At most {limit} ids can be deleted at once.'}, 400
 
-@app.route('/artists')
-def artists():
-    artists = Artist.query.all()
-    return render_template('pages/artists.html', artists=artists)
+    try:
+        names = delete_and_invalidate(model, ids)
+    except SQLAlchemyError:
+        db.session.rollback()
+        app.logger.exception('Could not delete %s %s', model.__tablename__,
+                             ids)
+        return {'error': f'The {model.__tablename__} could not be '
+                         'deleted.'}, 500
+    finally:
+        db.session.close()
+
+    return {'deleted': sorted(names),
+            'missing': sorted(set(ids) - set(names))}
+
+#  Artists
+#  ----------------------------------------------------------------
 
 
-@app.route('/artists/search', methods=['POST'])
-def search_artists():
-    search_term = request.form.get('search_term', '').strip()
-    response = Artist.query.filter(
-        Artist.name.ilike('%' + search_term + '%')).all()
+@read_view('/artists')
+def artists(session):
+    facets = parse_facets(request.args)
+    page = paginate(session.query(Artist)
+                    .filter(*facet_filters(Artist, facets)),
+                    order_by=(Artist.name, Artist.id),
+                    key=lambda artist: (artist.name, artist.id))
+    return render_template('pages/artists.html',
+                           artists=page,
+                           page=page,
+                           facets=facets,
+                           facet_counts=listing_facet_counts(session, Artist,
+                                                             facets))
+
+
+@read_view('/artists/search', methods=['GET', 'POST'])
+def search_artists(session):
+    search_term = request.values.get('search_term', '').strip()
+    facets = parse_facets(request.values)
+    response = search_engine.search(Artist, search_term,
+                                    facet_filters(Artist, facets), session)
 
     return render_template('pages/search_artists.html',
                            results=response,
-                           search_term=search_term)
+                           search_term=search_term,
+                           facets=facets,
+                           facet_counts=count_result_facets(response))
 
 
-@app.route('/artists/<int:artist_id>')
-def show_artist(artist_id):
-    artist = Artist.query.get(artist_id)
-    shows = db.session.query(
-        Show.artist_id,
-        Show.venue_id,
-        Show.start_time,
-        Venue.name,
-        Venue.image_link,
-    ).join(Venue).filter(Show.artist_id == artist_id)
-    upcoming_shows = shows.filter(Show.start_time >= datetime.now()).all()
-    past_shows = shows.filter(Show.start_time < datetime.now()).all()
+@read_view('/artists/<int:artist_id>')
+def show_artist(session, artist_id):
+    detail = cache.get_or_set(f'artist:{artist_id}',
+                              lambda: load_artist_detail(session, artist_id))
+    if detail is None:
+        abort(404)
+    upcoming_shows, past_shows = partition_shows(detail['shows'])
 
     return render_template('pages/show_artist.html',
-                           artist=artist,
+                           artist=detail['artist'],
                            upcoming_shows=upcoming_shows,
                            past_shows=past_shows)
 
+
+@read_view('/artists/<int:artist_id>/matches')
+def artist_matches(session, artist_id):
+    return entity_matches(session, Artist, artist_id)
+
+
+def load_artist_detail(session, artist_id):
+    rows = session.query(
+        Artist,
+        Show.start_time,
+        Venue.id.label('venue_id'),
+        Venue.name.label('venue_name'),
+        Venue.image_link.label('venue_image_link')
+    ).outerjoin(Show, Show.artist_id == Artist.id) \
+        .outerjoin(Venue, Venue.id == Show.venue_id) \
+        .filter(Artist.id == artist_id) \
+        .order_by(Show.start_time).all()
+    if not rows:
+        return None
+
+    return {'artist': entity_dict(rows[0].Artist),
+            'shows': detail_shows(rows, 'Artist')}
+
 #  Update
 #  ----------------------------------------------------------------
 
@@ -224,25 +581,7 @@ def edit_artist(artist_id):
 
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
-    artist = Artist.query.get(artist_id)
-    form = ArtistForm(request.form, obj=artist, meta={'csrf': False})
-    artist_name = request.form.get('name')
-    error_text = f'Error occured: Artist \'{artist_name}\' could not be edited.'
-
-    try:
-        form.populate_obj(artist)
-        db.session.add(artist)
-        db.session.commit()
-        flash('Artist \'' + artist_name + '\' was successfully edited!')
-    except SQLAlchemyError as e:
-        db.session.rollback()
-        print(sys.exc_info())
-        print(str(e.orig))
-        flash(error_text)
-    finally:
-        db.session.close()
-
-    return redirect(url_for('show_artist', artist_id=artist_id))
+    return edit_submission(Artist, artist_id)
 
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
@@ -255,25 +594,165 @@ def edit_venue(venue_id):
 
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
-    venue = Venue.query.get(venue_id)
-    form = VenueForm(request.form, obj=venue, meta={'csrf': False})
+    return edit_submission(Venue, venue_id)
+
+
+def update_and_invalidate(model, updates):
+    """Apply ``(id, version, values)`` updates in one transaction; returns
+    the new versions by id and the conflicts, committing only if there are
+    none."""
+    versions, conflicts = apply_updates(db.session, model, updates)
+    if conflicts:
+        db.session.rollback()
+        return versions, conflicts
+    db.session.commit()
+    cache_keys = venue_cache_keys if model is Venue else artist_cache_keys
+    keys = []
+    for entity_id, version, values in updates:
+        if 'name' in values:
+            search_engine.update(model, entity_id, values['name'])
+        matcher.update(model, entity_id, values)
+        keys.extend(cache_keys(entity_id))
+    cache.bump(model.__tablename__)
+    invalidate(keys)
+    return versions, conflicts
+
+
+def edit_submission(model, entity_id):
+    label = model.__name__
+    kind = label.lower()
+    form = FORMS[model](request.form, meta={'csrf': False})
+    # Posted by the edit forms; without it the edit is applied regardless
+    # of concurrent changes.
+    version = request.form.get('version', type=int)
+
+    def edit_form(status, version=None):
+        entity = db.session.get(model, entity_id)
+        if entity is None:
+            abort(404)
+        return render_template(f'forms/edit_{kind}.html', form=form,
+                               version=version or entity.version,
+                               **{kind: entity}), status
+
+    if not form.validate():
+        message = []
+        for field, err in form.errors.items():
+            message.append(field + ' ' + '|'.join(err))
+        flash('Validation Error occured: ' + str(message))
+        return edit_form(400, version)
 
     try:
-        form.populate_obj(venue)
-        db.session.add(venue)
-        db.session.commit()
-        flash('Venue \'' + venue.name + '\' was successfully edited!')
-    except SQLAlchemyError as e:
+        values = changed_values(db.session, model, entity_id, form.data)
+        if values is None:
+            abort(404)
+        # Only the changed columns are written; an unchanged form writes
+        # nothing and cannot conflict.
+        conflicts = []
+        if values:
+            versions, conflicts = update_and_invalidate(
+                model, [(entity_id, version, values)])
+    except SQLAlchemyError:
         db.session.rollback()
-        print(sys.exc_info())
-        print(str(e.orig))
-        flash('Error occured: Venue \''
-              + request.form.get('name')
-              + '\' could not be edited.')
-    finally:
-        db.session.close()
+        app.logger.exception('Could not edit %s %s', kind, entity_id)
+        flash(f'Error occured: {label} \'{form.name.data}\' could not be '
+              'edited.')
+        return redirect(url_for(f'show_{kind}', **{f'{kind}_id': entity_id}))
+
+    if conflicts:
+        if conflicts[0].version is None:
+            abort(404)
+        flash(f'{label} \'{form.name.data}\' was changed by someone else '
+              'while you were editing it. Saving again will replace their '
+              'changes.')
+        return edit_form(409)
+
+    flash(f'{label} \'{form.name.data}\' was successfully edited!')
+    return redirect(url_for(f'show_{kind}', **{f'{kind}_id': entity_id}))
+
+
+@app.route('/venues/<int:venue_id>', methods=['PATCH'])
+def patch_venue(venue_id):
+    return patch_one(Venue, venue_id)
 
-    return redirect(url_for('show_venue', venue_id=venue_id))
+
+@app.route('/venues', methods=['PATCH'])
+def patch_venues():
+    return patch_many(Venue)
+
+
+def patch_one(model, entity_id):
+    # Expects {"version": 3, "changes": {"name": ..., ...}}.
+    body = request.get_json(silent=True) or {}
+    version = body.get('version')
+    if type(version) is not int:
+        return {'error': 'Expected an integer "version".'}, 400
+    try:
+        values = clean_changes(model, body.get('changes'))
+    except InvalidChanges as error:
+        return {'errors': error.errors}, 400
+
+    try:
+        versions, conflicts = update_and_invalidate(
+            model, [(entity_id, version, values)])
+    except SQLAlchemyError:
+        db.session.rollback()
+        app.logger.exception('Could not update %s %s',
+                             model.__name__.lower(), entity_id)
+        return {'error': f'{model.__name__} {entity_id} could not be '
+                         'updated.'}, 500
+    if conflicts:
+        if conflicts[0].version is None:
+            return {'error': f'{model.__name__} {entity_id} not found.'}, 404
+        return {'error': 'Version conflict.', 'id': entity_id,
+                'version': conflicts[0].version}, 409
+    return {'id': entity_id, 'version': versions[entity_id]}
+
+
+def patch_many(model):
+    # Expects {"updates": [{"id": 1, "version": 3, "changes": {...}}, ...]}
+    # and applies all of them or, on any conflict, none.
+    items = (request.get_json(silent=True) or {}).get('updates')
+    if not isinstance(items, list) or not items:
+        return {'error': 'Expected a non-empty list of "updates".'}, 400
+    limit = app.config['BULK_UPDATE_LIMIT']
+    if len(items) > limit:
+        return {'error': f'At most {limit} updates can be sent at once.'}, 400
+
+    updates = []
+    errors = {}
+    for position, item in enumerate(items):
+        if not isinstance(item, dict) or type(item.get('id')) is not int \
+                or type(item.get('version')) is not int:
+            errors[position] = {'update': ['Expected an integer "id" and '
+                                           '"version".']}
+            continue
+        try:
+            updates.append((item['id'], item['version'],
+                            clean_changes(model, item.get('changes'))))
+        except InvalidChanges as error:
+            errors[position] = error.errors
+    if len({entity_id for entity_id, version, values in updates}) \
+            < len(updates):
+        return {'error': 'Each id can only be updated once per batch.'}, 400
+    if errors:
+        return {'errors': errors}, 400
+
+    try:
+        versions, conflicts = update_and_invalidate(model, updates)
+    except SQLAlchemyError:
+        db.session.rollback()
+        app.logger.exception('Could not update %s %s', model.__tablename__,
+                             [entity_id for entity_id, version, values
+                              in updates])
+        return {'error': f'The {model.__tablename__} could not be '
+                         'updated; nothing was changed.'}, 500
+    if conflicts:
+        return {'error': 'Version conflict; nothing was updated.',
+                'conflicts': [{'id': conflict.entity_id,
+                               'version': conflict.version}
+                              for conflict in conflicts]}, 409
+    return {'updated': [{'id': entity_id, 'version': version}
+                        for entity_id, version in versions.items()]}
 
 #  Create Artist
 #  ----------------------------------------------------------------
@@ -297,11 +776,11 @@ def create_artist_submission():
             form.populate_obj(artist)
             db.session.add(artist)
             db.session.commit()
+            cache.bump('artists')
             flash('Artist \'' + artist_name + '\' was successfully listed!')
-        except SQLAlchemyError as e:
+        except SQLAlchemyError:
             db.session.rollback()
-            print(sys.exc_info())
-            print(str(e.orig))
+            app.logger.exception('Could not list artist %r', artist_name)
             flash(error_text)
         finally:
             db.session.close()
@@ -316,44 +795,56 @@ def create_artist_submission():
     return redirect(url_for('index'))
 
 
-@app.route('/artists/<artist_id>', methods=['DELETE'])
+@app.route('/artists/<int:artist_id>', methods=['DELETE'])
 def delete_artist(artist_id):
-    artist = Artist.query.get(artist_id)
-    error_text = f'Error occured: Artist \'{artist.name}\' could not be deleted.'
+    return delete_one(Artist, artist_id)
 
-    if artist is None:
-        redirect(url_for('not_found_error', error='Artist not found'))
 
-    try:
-        db.session.delete(artist)
-        db.session.commit()
-        flash('Artist \'' + artist.name + '\' was successfully deleted!')
-    except SQLAlchemyError as e:
-        db.session.rollback()
-        print(sys.exc_info())
-        print(str(e.orig))
-        flash(error_text)
-    finally:
-        db.session.close()
+@app.route('/artists/delete', methods=['POST'])
+def bulk_delete_artists():
+    return bulk_delete(Artist)
 
-    return redirect(url_for('index'))
+
+@app.route('/artists/<int:artist_id>', methods=['PATCH'])
+def patch_artist(artist_id):
+    return patch_one(Artist, artist_id)
+
+
+@app.route('/artists', methods=['PATCH'])
+def patch_artists():
+    return patch_many(Artist)
 
 
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
-def shows():
-    shows = db.session.query(
+@read_view('/shows')
+def shows(session):
+    key = 'shows:{}:{}:{}'.format(cache.generation('shows'),
+                                  request.args.get('after'),
+                                  request.args.get('before'))
+    page = cache.get_or_set(key, lambda: load_shows_page(session))
+
+    return render_template('pages/shows.html', shows=page, page=page)
+
+
+def load_shows_page(session):
+    query = session.query(
+        Show.id,
         Show.venue_id,
-        Venue.name,
+        Venue.name.label('venue_name'),
+        Venue.version.label('venue_version'),
         Show.artist_id,
         Show.start_time,
-        Artist.name,
-        Artist.image_link
-    ).join(Venue).join(Artist).all()
-
-    return render_template('pages/shows.html', shows=shows)
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Artist.version.label('artist_version')
+    ).join(Venue).join(Artist)
+    page = paginate(query,
+                    order_by=(Show.start_time, Show.id),
+                    key=lambda show: (show.start_time, show.id))
+    page.items = [show._asdict() for show in page.items]
+    return page
 
 
 @app.route('/shows/create')
@@ -366,21 +857,7 @@ def create_shows():
 def create_show_submission():
     form = ShowForm(request.form, meta={'csrf': False})
 
-    if form.validate():
-        try:
-            show = Show()
-            form.populate_obj(show)
-            db.session.add(show)
-            db.session.commit()
-            flash('Show was successfully listed!')
-        except SQLAlchemyError as e:
-            db.session.rollback()
-            print(sys.exc_info())
-            print(str(e.orig))
-            flash('Error occured: Failed to create show.')
-        finally:
-            db.session.close()
-    else:
+    if not form.validate():
         message = []
         for field, err in form.errors.items():
             message.append(field + ' ' + '|'.join(err))
@@ -388,9 +865,73 @@ def create_show_submission():
         form = ShowForm()
         return render_template('forms/new_show.html', form=form)
 
+    conflicts = find_conflicts(
+        db.session, form.venue_id.data, form.artist_id.data,
+        form.start_time.data, form.end_time.data)
+    if conflicts:
+        form.start_time.errors = conflict_messages(
+            int(form.venue_id.data), int(form.artist_id.data), conflicts)
+        flash('Show could not be listed: the time slot is already booked.')
+        return render_template('forms/new_show.html', form=form), 409
+
+    try:
+        show = Show()
+        form.populate_obj(show)
+        db.session.add(show)
+        db.session.commit()
+        invalidate([f'venue:{show.venue_id}', f'artist:{show.artist_id}'])
+        flash('Show was successfully listed!')
+    except IntegrityError as error:
+        db.session.rollback()
+        if getattr(error.orig, 'pgcode', None) != EXCLUSION_VIOLATION:
+            app.logger.exception('Could not list show')
+            flash('Error occured: Failed to create show.')
+            return redirect(url_for('index'))
+        # Another request booked the slot between the check and the insert,
+        # and the exclusion constraints rejected this show.
+        form.start_time.errors = ['The venue or artist was booked for this '
+                                  'time while the show was being listed.']
+        flash('Show could not be listed: the time slot is already booked.')
+        return render_template('forms/new_show.html', form=form), 409
+    except SQLAlchemyError:
+        db.session.rollback()
+        app.logger.exception('Could not list show')
+        flash('Error occured: Failed to create show.')
+    finally:
+        db.session.close()
+
     return redirect(url_for('index'))
 
 
+#  Export
+#  ----------------------------------------------------------------
+
+@app.route('/export/<any(venues, artists, shows):kind>.<format>')
+def export_data(kind, format):
+    if format not in EXPORT_FORMATS:
+        abort(404)
+    try:
+        filters = parse_export_filters(request.args)
+    except ValueError:
+        abort(400)
+
+    rows = export(db.session, kind, format, filters)
+    return Response(stream_with_context(rows),
+                    mimetype=EXPORT_FORMATS[format],
+                    headers={'Content-Disposition':
+                             f'attachment; filename={kind}.{format}'})
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    return {**cache.stats(), 'fragments': fragments.stats()}
+
+
+@app.route('/pool/stats')
+def database_pool_stats():
+    return pool_stats(db.engine)
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -401,16 +942,128 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s:'
-                  ' %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+# ----------------------------------------------------------------------------#
+# Commands.
+# ----------------------------------------------------------------------------#
+
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORT_KINDS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=5000, show_default=True,
+              help='Rows validated and loaded per transaction.')
+@click.option('--rejects', type=click.Path(dir_okay=False),
+              help='Where rejected rows are written as JSON lines '
+                   '[default: PATH.rejects.jsonl].')
+def import_data(kind, path, batch_size, rejects):
+    """Bulk load venues, artists or shows from a CSV or JSONL file.
+
+    Running workers see imported venues and artists in search and matches
+    once they see the cache bump: within CACHE_LOCAL_TTL seconds with a
+    shared cache (CACHE_SHARED_URL); without one, after a restart, or within
+    MATCH_INDEX_TTL for matches.
+    """
+    rejects = rejects or path + '.rejects.jsonl'
+    with open(rejects, 'w', encoding='utf-8') as rejects_file:
+        report = import_rows(
+            db.session, kind, read_rows(path),
+            batch_size=batch_size,
+            rejects=rejects_file,
+            progress=lambda report: click.echo(f'{kind}: {report}'))
+    if kind == 'shows':
+        # COPY bypasses the ORM events that maintain the show counts.
+        recount(db.session)
+        cache.clear()
+    else:
+        cache.bump(kind)
+        cache.bump('indexes')
+    click.echo(f'Done. {report}. Rejected rows: {rejects}')
+
+
+@app.cli.command('export')
+@click.argument('kind', type=click.Choice(['venues', 'artists', 'shows']))
+@click.option('--format', 'format', type=click.Choice(sorted(EXPORT_FORMATS)),
+              default='csv', show_default=True)
+@click.option('--start', help='Only shows starting at or after this time.')
+@click.option('--end', help='Only shows starting before this time.')
+@click.option('--venue-id', help='Only shows at this venue.')
+@click.option('--artist-id', help='Only shows by this artist.')
+@click.option('--output', '-o', type=click.File('w'), default='-',
+              help='Output file [default: stdout].')
+def export_command(kind, format, start, end, venue_id, artist_id, output):
+    """Stream venues, artists or shows out as CSV or NDJSON."""
+    try:
+        filters = parse_export_filters({'start': start,
+                                        'end': end,
+                                        'venue_id': venue_id,
+                                        'artist_id': artist_id})
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    for chunk in export(db.session, kind, format, filters):
+        output.write(chunk)
+
+
+@app.cli.group('assets')
+def assets_command():
+    """Build fingerprinted static assets."""
+
+
+@assets_command.command('build')
+def build_assets_command():
+    """Bundle, minify, fingerprint and precompress static files."""
+    manifest = build_assets(app)
+    click.echo(f'{len(manifest)} assets written to '
+               f'{app.config["ASSETS_DIR"]}.')
+
+
+@app.cli.group('venues')
+def venues_command():
+    """Maintain venue data."""
+
+
+@venues_command.command('geocode')
+@click.argument('gazetteer', type=click.Path(exists=True, dir_okay=False))
+@click.option('--all', 'everything', is_flag=True,
+              help='Locate venues that already have coordinates again.')
+@click.option('--batch-size', default=5000, show_default=True,
+              help='Venues updated per transaction.')
+def geocode_venues(gazetteer, everything, batch_size):
+    """Set venue coordinates from a CSV of places.
+
+    GAZETTEER has city, state, latitude and longitude columns and an
+    optional address column; venues are matched on address, city and state
+    first, then on city and state alone.
+    """
+    try:
+        places = load_gazetteer(gazetteer)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+    located, unmatched = geocode(db.session, places, everything, batch_size)
+    click.echo(f'{located} venues located, {unmatched} not found in '
+               f'{gazetteer}.')
+
+
+@app.cli.group('shows')
+def shows_command():
+    """Maintain the upcoming and past show counts."""
+
+
+@shows_command.command('roll')
+def roll_shows():
+    """Move shows that have started into the past counts.
+
+    Run periodically, e.g. every few minutes from cron; listings show
+    upcoming counts as of the last roll.
+    """
+    click.echo(f'{roll(db.session)} shows moved to past.')
+
+
+@shows_command.command('recount')
+def recount_shows():
+    """Recompute every venue's and artist's show counts."""
+    recount(db.session)
+    click.echo('Show counts recomputed.')
+
 
 # ----------------------------------------------------------------------------#
 # Launch.
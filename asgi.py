@@ -0,0 +1,178 @@
+"""ASGI entry point serving the read-only views on async database sessions.
+
+    uvicorn asgi:application --workers 4
+
+Views registered with ``read_view`` in app.py (the venue, artist and show
+listings, detail pages and searches) run on an ``AsyncSession`` over
+asyncpg, so a request waiting on the database holds no thread. They are the
+same view functions the WSGI app serves, called through
+``AsyncSession.run_sync`` inside a regular Flask request context, so the
+models, templates, cache and request hooks are all shared. Every other
+route is handed to the WSGI app on a thread pool.
+
+Needs the ``asgiref`` and ``asyncpg`` packages, plus an ASGI server; see
+``requirements-optional.txt``.
+"""
+import asyncio
+import io
+import sys
+
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.exceptions import HTTPException
+
+from app import app, READ_VIEWS, matcher, search_engine
+from models import Venue, Artist
+
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_database_url(url):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(),
+                                                url.drivername))
+
+
+def build_environ(scope, body=b''):
+    """WSGI environ for an ASGI HTTP scope."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '')
+        .encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = \
+            scope['client'][0], str(scope['client'][1])
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = value.decode('latin-1')
+        if name in environ:
+            value = environ[name] + ',' + value
+        environ[name] = value
+    return environ
+
+
+async def read_body(receive):
+    body = []
+    more_body = True
+    while more_body:
+        message = await receive()
+        body.append(message.get('body', b''))
+        more_body = message.get('more_body', False)
+    return b''.join(body)
+
+
+class AsyncReadApp:
+    def __init__(self, flask_app, views):
+        self.flask_app = flask_app
+        self.views = views
+        self.wsgi = WsgiToAsgi(flask_app)
+        config = flask_app.config
+        self.engine = create_async_engine(
+            async_database_url(config['ASYNC_DATABASE_URI'] or
+                               config['SQLALCHEMY_DATABASE_URI']),
+            **config['ASYNC_ENGINE_OPTIONS'])
+        self.sessions = async_sessionmaker(self.engine,
+                                           expire_on_commit=False)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f'Unsupported ASGI scope {scope["type"]!r}')
+
+        environ = build_environ(scope)
+        try:
+            endpoint, view_args = self.flask_app.url_map \
+                .bind_to_environ(environ).match()
+        except HTTPException:
+            endpoint = None
+        view = self.views.get(endpoint)
+        if view is None:
+            return await self.wsgi(scope, receive, send)
+
+        environ['wsgi.input'] = io.BytesIO(await read_body(receive))
+        response = await self.dispatch(environ, view, view_args)
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': response.status_code,
+                'headers': [(name.lower().encode('latin-1'),
+                             value.encode('latin-1'))
+                            for name, value in response.headers.items()],
+            })
+            await send({
+                'type': 'http.response.body',
+                'body': b'' if scope['method'] == 'HEAD'
+                else response.get_data(),
+            })
+        finally:
+            response.close()
+
+    async def dispatch(self, environ, view, view_args):
+        # Flask's full_dispatch_request, with the view awaited. Context
+        # variables follow run_sync into the view, so request, g and
+        # current_app work there as usual.
+        flask_app = self.flask_app
+        with flask_app.request_context(environ):
+            try:
+                try:
+                    rv = flask_app.preprocess_request()
+                    if rv is None:
+                        async with self.sessions() as session:
+                            rv = await session.run_sync(view, **view_args)
+                except Exception as error:
+                    rv = flask_app.handle_user_exception(error)
+                return flask_app.finalize_request(rv)
+            except Exception as error:
+                return flask_app.make_response(
+                    flask_app.handle_exception(error))
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def startup(self):
+        # The in-memory search and match indexes are first built under a
+        # thread lock, which must not be waited on from the event loop;
+        # build them up front. Later match index rebuilds do not block.
+        await asyncio.to_thread(self._build_indexes)
+
+    def _build_indexes(self):
+        with self.flask_app.app_context():
+            for model in (Venue, Artist):
+                if not search_engine.uses_trigram_index():
+                    search_engine.index_for(model)
+                matcher.index_for(model)
+
+    async def shutdown(self):
+        await self.engine.dispose()
+
+
+application = AsyncReadApp(app, READ_VIEWS)
@@ -0,0 +1,231 @@
+"""Fingerprinted, bundled and precompressed static assets.
+
+``flask assets build`` copies every file under ``static/`` to
+``ASSETS_DIR`` with a content hash in its name, concatenates and minifies
+the bundles below, writes ``.gz`` (and ``.br`` when the brotli package is
+installed) variants and records the names in ``manifest.json``. Hashed
+files are served with far-future immutable cache headers; templates link to
+them through ``asset_url``/``asset_urls``, which fall back to the plain
+static files when no build exists.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import re
+
+from flask import abort, current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # brotli variants are optional
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:  # scripts are only concatenated without it
+    rjsmin = None
+
+BUNDLES = {
+    'css/app.css': [
+        'css/bootstrap.min.css',
+        'css/layout.main.css',
+        'css/main.css',
+        'css/main.responsive.css',
+        'css/main.quickfix.css',
+    ],
+    'js/head.js': [
+        'js/libs/modernizr-2.8.2.min.js',
+        'js/libs/moment.min.js',
+    ],
+    # Deferred scripts, in the order the layout used to load them.
+    'js/app.js': [
+        'js/script.js',
+        'js/libs/bootstrap-3.1.1.min.js',
+        'js/plugins.js',
+    ],
+}
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.eot', '.ttf',
+                '.otf', '.map')
+MANIFEST = 'manifest.json'
+
+CSS_TOKENS = re.compile(
+    r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')'''  # strings, kept as is
+    r'|(/\*(?!!).*?\*/)'                          # comments but /*! ... */
+    r'|\s*([{};,>])\s*'                           # space around punctuation
+    r'|(:)\s+'                                    # and after colons
+    r'|(\s+)',
+    re.S)
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+SOURCE_MAP = re.compile(r'^\s*//[#@] sourceMappingURL=.*$', re.M)
+
+
+def minify_css(css):
+    def replace(match):
+        string, comment, punctuation, colon, space = match.groups()
+        if string:
+            return string
+        if comment:
+            return ''
+        return punctuation or colon or ' '
+    return CSS_TOKENS.sub(replace, css).replace(';}', '}').strip()
+
+
+def minify_js(js):
+    js = SOURCE_MAP.sub('', js)
+    return rjsmin.jsmin(js) if rjsmin is not None else js.strip()
+
+
+def fingerprint(name, content):
+    root, ext = posixpath.splitext(name)
+    return f'{root}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+
+
+def _rewrite_css_urls(css, source, manifest, url_prefix, static_url):
+    # Bundles live in another directory than their sources, so relative
+    # urls are resolved against the source file and pointed at the
+    # fingerprinted copy when there is one.
+    def replace(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return match.group(0)
+        path, suffix = re.match(r'([^?#]*)(.*)', url).groups()
+        target = posixpath.normpath(
+            posixpath.join(posixpath.dirname(source), path))
+        if target in manifest:
+            resolved = f'{url_prefix}/{manifest[target]}'
+        else:
+            resolved = f'{static_url}/{target}'
+        return f'url({quote}{resolved}{suffix}{quote})'
+    return CSS_URL.sub(replace, css)
+
+
+def _write(directory, name, content):
+    path = os.path.join(directory, *name.split('/'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as output:
+        output.write(content)
+    if name.endswith(COMPRESSIBLE):
+        variants = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(content)
+        for suffix, compressed in variants.items():
+            # Serving a variant only pays off when it is smaller.
+            if len(compressed) < len(content):
+                with open(path + suffix, 'wb') as output:
+                    output.write(compressed)
+
+
+def _static_files(static_folder, exclude):
+    for root, directories, files in os.walk(static_folder):
+        directories[:] = [directory for directory in directories
+                          if os.path.join(root, directory) != exclude]
+        for filename in files:
+            path = os.path.join(root, filename)
+            yield os.path.relpath(path, static_folder).replace(os.sep, '/')
+
+
+def build(app):
+    """Write fingerprinted files and bundles; returns the manifest."""
+    static_folder = app.static_folder
+    directory = app.config['ASSETS_DIR']
+    url_prefix = app.config['ASSETS_URL_PATH']
+    manifest = {}
+
+    # Every static file is copied under a hashed name, so single files and
+    # fonts referenced by the bundles can be served immutable too.
+    # Earlier builds are left in place so pages rendered before a deploy
+    # can still load their assets.
+    for name in _static_files(static_folder, os.path.abspath(directory)):
+        if name.startswith('.') or posixpath.basename(name).startswith('.'):
+            continue
+        with open(os.path.join(static_folder, name), 'rb') as source:
+            content = source.read()
+        manifest[name] = fingerprint(name, content)
+        _write(directory, manifest[name], content)
+
+    for bundle, sources in BUNDLES.items():
+        parts = []
+        for name in sources:
+            with open(os.path.join(static_folder, name),
+                      encoding='utf-8') as source:
+                text = source.read()
+            if bundle.endswith('.css'):
+                parts.append(minify_css(_rewrite_css_urls(
+                    text, name, manifest, url_prefix,
+                    app.static_url_path)))
+            else:
+                parts.append(minify_js(text))
+        separator = '\n' if bundle.endswith('.css') else '\n;\n'
+        content = separator.join(parts).encode('utf-8')
+        manifest[bundle] = fingerprint(bundle, content)
+        _write(directory, manifest[bundle], content)
+
+    path = os.path.join(directory, MANIFEST)
+    with open(path + '.tmp', 'w') as output:
+        json.dump(manifest, output, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+    app.extensions['assets'] = manifest
+    return manifest
+
+
+def load_manifest(app):
+    path = os.path.join(app.config['ASSETS_DIR'], MANIFEST)
+    try:
+        with open(path) as source:
+            return json.load(source)
+    except FileNotFoundError:
+        return {}
+
+
+def asset_url(name):
+    """URL of a fingerprinted static file, or the plain static URL when it
+    has not been built."""
+    manifest = current_app.extensions['assets']
+    if name in manifest:
+        return url_for('asset', filename=manifest[name])
+    return url_for('static', filename=name)
+
+
+def asset_urls(bundle):
+    # The bundle when it has been built, its source files otherwise.
+    if bundle in current_app.extensions['assets']:
+        return [asset_url(bundle)]
+    return [url_for('static', filename=name) for name in BUNDLES[bundle]]
+
+
+def serve_asset(filename):
+    directory = current_app.config['ASSETS_DIR']
+    if filename == MANIFEST:
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or \
+        'application/octet-stream'
+    encodings = request.accept_encodings
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if encodings[encoding] and os.path.isfile(
+                os.path.join(directory, *(filename + suffix).split('/'))):
+            response = send_from_directory(
+                directory, filename + suffix, mimetype=mimetype,
+                max_age=current_app.config['ASSETS_MAX_AGE'])
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_from_directory(
+            directory, filename, mimetype=mimetype,
+            max_age=current_app.config['ASSETS_MAX_AGE'])
+    # The name changes whenever the content does, so clients never need to
+    # revalidate.
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_assets(app):
+    app.extensions['assets'] = load_manifest(app)
+    app.add_url_rule(app.config['ASSETS_URL_PATH'] + '/<path:filename>',
+                     'asset', serve_asset)
+    app.add_template_global(asset_url)
+    app.add_template_global(asset_urls)
@@ -0,0 +1,40 @@
+"""Compare two harness result files route by route.
+
+Run with ``python -m benchmarks.compare BASELINE.json CANDIDATE.json``.
+"""
+import json
+import sys
+
+METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request')
+
+
+def load(path):
+    with open(path) as results:
+        return json.load(results)
+
+
+def change(before, after):
+    if not before:
+        return ''
+    return f'{(after - before) / before * 100:+7.1f}%'
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        sys.exit('usage: python -m benchmarks.compare BASELINE CANDIDATE')
+    baseline, candidate = load(argv[0]), load(argv[1])
+    print(f'{baseline.get("revision")} -> {candidate.get("revision")}, '
+          f'{candidate["scale"]} shows on {candidate["database"]}')
+    for name, after in candidate['routes'].items():
+        before = baseline['routes'].get(name)
+        if before is None:
+            continue
+        cells = [f'{metric} {before[metric]:.2f} -> {after[metric]:.2f} '
+                 f'{change(before[metric], after[metric])}'
+                 for metric in METRICS]
+        print(f'{name:<24} ' + '  '.join(cells))
+
+
+if __name__ == '__main__':
+    main()
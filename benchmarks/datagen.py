@@ -0,0 +1,188 @@
+"""Deterministic synthetic venues, artists and shows.
+
+The same seed, scale and anchor always produce the same rows, so benchmark
+runs against freshly generated databases are comparable.
+"""
+import random
+from datetime import datetime, timedelta
+
+from enums import Genre
+from counters import recount
+from geo import set_locations
+from importer import IMPORT_KINDS, copy_batch
+
+CITIES = (
+    ('San Francisco', 'CA'), ('Los Angeles', 'CA'), ('New York', 'NY'),
+    ('Brooklyn', 'NY'), ('Austin', 'TX'), ('Houston', 'TX'),
+    ('Chicago', 'IL'), ('Seattle', 'WA'), ('Portland', 'OR'),
+    ('Nashville', 'TN'), ('New Orleans', 'LA'), ('Denver', 'CO'),
+    ('Atlanta', 'GA'), ('Boston', 'MA'), ('Detroit', 'MI'),
+    ('Minneapolis', 'MN'), ('Philadelphia', 'PA'), ('Miami', 'FL'),
+)
+# City centres; generated venues are scattered up to LOCATION_SPREAD
+# degrees around them.
+CITY_LOCATIONS = {
+    'San Francisco': (37.7749, -122.4194), 'Los Angeles': (34.0522, -118.2437),
+    'New York': (40.7128, -74.0060), 'Brooklyn': (40.6782, -73.9442),
+    'Austin': (30.2672, -97.7431), 'Houston': (29.7604, -95.3698),
+    'Chicago': (41.8781, -87.6298), 'Seattle': (47.6062, -122.3321),
+    'Portland': (45.5152, -122.6784), 'Nashville': (36.1627, -86.7816),
+    'New Orleans': (29.9511, -90.0715), 'Denver': (39.7392, -104.9903),
+    'Atlanta': (33.7490, -84.3880), 'Boston': (42.3601, -71.0589),
+    'Detroit': (42.3314, -83.0458), 'Minneapolis': (44.9778, -93.2650),
+    'Philadelphia': (39.9526, -75.1652), 'Miami': (25.7617, -80.1918),
+}
+LOCATION_SPREAD = 0.2
+ADJECTIVES = (
+    'Blue', 'Golden', 'Velvet', 'Electric', 'Midnight', 'Silver', 'Wild',
+    'Crimson', 'Lucky', 'Hidden', 'Rusty', 'Neon', 'Little', 'Grand',
+)
+NOUNS = (
+    'Room', 'Hall', 'Lounge', 'Garden', 'Tavern', 'Club', 'Cellar', 'Barn',
+    'Hop', 'Stage', 'Parlor', 'Den', 'Warehouse', 'Theatre',
+)
+BAND_WORDS = (
+    'Guns', 'Petals', 'Wolves', 'Sparrows', 'Machines', 'Echoes', 'Rivers',
+    'Kings', 'Ghosts', 'Satellites', 'Tigers', 'Lanterns', 'Orchids',
+)
+GENRES = [genre.name for genre in Genre]
+
+# Rows generated per venue and per artist for a given number of shows.
+SHOWS_PER_VENUE = 20
+SHOWS_PER_ARTIST = 10
+SLOT_HOURS = 2
+
+
+def parse_scale(value):
+    value = str(value).strip().lower()
+    multiplier = {'k': 1000, 'm': 1000000}.get(value[-1:], 1)
+    if multiplier != 1:
+        value = value[:-1]
+    return int(float(value) * multiplier)
+
+
+def _phone(rng):
+    return '{:03d}-{:03d}-{:04d}'.format(
+        rng.randrange(200, 999), rng.randrange(100, 999),
+        rng.randrange(10000))
+
+
+def venue_rows(rng, count):
+    for i in range(count):
+        city, state = rng.choice(CITIES)
+        name = f'The {rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}'
+        yield {
+            'name': name,
+            'city': city,
+            'state': state,
+            'address': f'{rng.randrange(1, 9999)} Main Street',
+            'phone': _phone(rng),
+            'image_link': f'https://images.example.com/venues/{i}.jpg',
+            'facebook_link': f'https://www.facebook.com/venue{i}',
+            'genres': rng.sample(GENRES, rng.randrange(1, 4)),
+            'website_link': f'https://venue{i}.example.com',
+            'seeking_talent': rng.random() < 0.4,
+            'seeking_description': 'Looking for local acts.',
+        }
+
+
+def artist_rows(rng, count):
+    for i in range(count):
+        city, state = rng.choice(CITIES)
+        name = f'{rng.choice(BAND_WORDS)} N {rng.choice(BAND_WORDS)} {i}'
+        yield {
+            'name': name,
+            'city': city,
+            'state': state,
+            'phone': _phone(rng),
+            'image_link': f'https://images.example.com/artists/{i}.jpg',
+            'facebook_link': f'https://www.facebook.com/artist{i}',
+            'genres': rng.sample(GENRES, rng.randrange(1, 3)),
+            'website_link': f'https://artist{i}.example.com',
+            'seeking_venue': rng.random() < 0.5,
+            'seeking_description': 'Looking for shows.',
+        }
+
+
+def show_rows(rng, count, venue_ids, artist_ids, anchor):
+    # Shows fill two hour slots within a year either side of ``anchor``, so
+    # roughly half of them are upcoming. A slot already taken by the venue
+    # or the artist is drawn again, as the schedule may not overlap.
+    slots = 365 * 24 // SLOT_HOURS
+    taken = set()
+    produced = 0
+    while produced < count:
+        venue_id = rng.choice(venue_ids)
+        artist_id = rng.choice(artist_ids)
+        slot = rng.randrange(-slots, slots)
+        if ('venue', venue_id, slot) in taken or \
+                ('artist', artist_id, slot) in taken:
+            continue
+        taken.add(('venue', venue_id, slot))
+        taken.add(('artist', artist_id, slot))
+        produced += 1
+        start_time = anchor + timedelta(hours=slot * SLOT_HOURS)
+        yield {
+            'venue_id': venue_id,
+            'artist_id': artist_id,
+            'start_time': start_time,
+            'end_time': start_time + timedelta(hours=SLOT_HOURS),
+        }
+
+
+def _load(session, kind, rows, batch_size):
+    model, form_class, columns = IMPORT_KINDS[kind]
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            copy_batch(session, model, columns, batch)
+            session.commit()
+            batch = []
+    if batch:
+        copy_batch(session, model, columns, batch)
+        session.commit()
+
+
+def _locate_venues(session, seed):
+    # A separate generator, so the other rows do not depend on this step.
+    from models import Venue
+
+    rng = random.Random(f'{seed}-locations')
+    locations = []
+    for venue_id, city in session.query(Venue.id, Venue.city) \
+            .order_by(Venue.id):
+        latitude, longitude = CITY_LOCATIONS[city]
+        locations.append((
+            venue_id,
+            latitude + rng.uniform(-LOCATION_SPREAD, LOCATION_SPREAD),
+            longitude + rng.uniform(-LOCATION_SPREAD, LOCATION_SPREAD)))
+    if locations:
+        set_locations(session, locations)
+        session.commit()
+
+
+def generate(session, shows=10000, seed=0, anchor=None, batch_size=5000):
+    """Load ``shows`` shows plus proportional venues and artists into an
+    empty database and return the row counts."""
+    from models import Venue, Artist
+
+    rng = random.Random(seed)
+    if anchor is None:
+        anchor = datetime.now().replace(hour=0, minute=0, second=0,
+                                        microsecond=0)
+    venues = max(shows // SHOWS_PER_VENUE, 1)
+    artists = max(shows // SHOWS_PER_ARTIST, 1)
+
+    _load(session, 'venues', venue_rows(rng, venues), batch_size)
+    _locate_venues(session, seed)
+    _load(session, 'artists', artist_rows(rng, artists), batch_size)
+    venue_ids = [venue_id for venue_id, in
+                 session.query(Venue.id).order_by(Venue.id)]
+    artist_ids = [artist_id for artist_id, in
+                  session.query(Artist.id).order_by(Artist.id)]
+    _load(session, 'shows',
+          show_rows(rng, shows, venue_ids, artist_ids, anchor), batch_size)
+    recount(session)
+
+    return {'venues': venues, 'artists': artists, 'shows': shows}
@@ -0,0 +1,64 @@
+"""Per-call cost of the ``datetime`` template filter on a 10k-show page.
+
+Run with ``python -m benchmarks.datetime_filter``.
+"""
+import random
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from app import format_datetime, _format_datetime
+
+SHOWS = 10000
+
+
+def legacy_format_datetime(value, format='medium'):
+    # The filter as it was before patterns were precompiled and memoized.
+    if isinstance(value, str):
+        date = dateutil.parser.parse(value)
+    else:
+        date = value
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def show_times(count, seed=0):
+    # Shows start on the hour across a year, so timestamps repeat.
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1, 18)
+    return [start + timedelta(hours=rng.randrange(24 * 365))
+            for _ in range(count)]
+
+
+def measure(filter_function, values, repeat=5):
+    def render_page():
+        for value in values:
+            filter_function(value, 'full')
+
+    best = min(timeit.repeat(render_page, number=1, repeat=repeat))
+    return best / len(values) * 1e6
+
+
+def main():
+    values = show_times(SHOWS)
+    assert all(format_datetime(value, 'full') ==
+               legacy_format_datetime(value, 'full') for value in values)
+
+    results = {'legacy': measure(legacy_format_datetime, values)}
+    _format_datetime.cache_clear()
+    results['cold'] = measure(format_datetime, values, repeat=1)
+    results['warm'] = measure(format_datetime, values)
+
+    print(f'{SHOWS} shows, {len(set(values))} distinct start times')
+    for name, per_call in results.items():
+        print(f'{name:>8}: {per_call:8.2f} us/call '
+              f'{per_call * SHOWS / 1000:8.1f} ms/page')
+
+
+if __name__ == '__main__':
+    main()
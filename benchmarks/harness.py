@@ -0,0 +1,475 @@
+"""Drive every route against a generated database and report latency.
+
+Run with ``python -m benchmarks.harness --scale 10k``. The harness uses the
+``testing`` config profile unless FYYUR_ENV says otherwise, drops and
+recreates that database, loads deterministic data from
+``benchmarks.datagen`` and sends requests through the Flask test client so
+no network or server process sits between the measurement and the app.
+
+For each route it records p50/p95/p99 latency, throughput and SQL
+statements per request, prints a table and writes the numbers as JSON to
+``benchmarks/results/`` for comparison across runs.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault('FYYUR_ENV', 'testing')
+
+from benchmarks.datagen import (  # noqa
+    CITIES,
+    CITY_LOCATIONS,
+    GENRES,
+    generate,
+    parse_scale
+)
+from sqlalchemy import func  # noqa
+
+from app import app, cache, fragments, images  # noqa
+from assets import BUNDLES, build as build_assets  # noqa
+from models import db, Venue, Artist, Show  # noqa
+from pagination import encode_cursor  # noqa
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+BENCH_PREFIX = 'Bench'
+SHOW_SLOTS_START = datetime(2100, 1, 1)
+BULK_DELETE_SIZE = 20
+BULK_UPDATE_SIZE = 20
+CURSOR_SAMPLE = 1000
+# Served from IMAGE_LOCAL_DIR by the testing profile's local fetcher.
+IMAGE_SOURCE = 'https://images.example.com/front-splash.jpg'
+
+
+class JSONBody(dict):
+    """Scenario data sent as a JSON request body rather than a form."""
+
+
+def _cursors(*columns):
+    # Cursors just past a sample of rows, for pages deep in a listing.
+    return [encode_cursor(row) for row in db.session.query(*columns)
+            .order_by(func.random()).limit(CURSOR_SAMPLE)]
+
+
+class Fixture:
+    """Ids and terms the request scenarios pick from."""
+
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.venue_ids = [venue_id for venue_id, in
+                          db.session.query(Venue.id).order_by(Venue.id)]
+        self.artist_ids = [artist_id for artist_id, in
+                           db.session.query(Artist.id).order_by(Artist.id)]
+        self.created_venues = []
+        self.created_artists = []
+        self.counter = 0
+        # Patches send the version each row is at, so they measure updates
+        # rather than version conflicts; edits without a version run later.
+        self.versions = {
+            model: dict(db.session.query(model.id, model.version))
+            for model in (Venue, Artist)}
+        self.patched = {Venue: 0, Artist: 0}
+        self.venue_cursors = _cursors(Venue.city, Venue.state, Venue.id)
+        self.artist_cursors = _cursors(Artist.name, Artist.id)
+        self.show_cursors = _cursors(Show.start_time, Show.id)
+        self.image_token = images.signer.dumps(IMAGE_SOURCE)
+        manifest = app.extensions['assets']
+        self.assets = [manifest[bundle] for bundle in BUNDLES
+                       if bundle in manifest]
+
+    def choice(self, values):
+        with self.lock:
+            return self.rng.choice(values)
+
+    def next_number(self):
+        with self.lock:
+            self.counter += 1
+            return self.counter
+
+    def pop(self, values):
+        with self.lock:
+            return values.pop() if values else None
+
+    def pop_many(self, values, count):
+        with self.lock:
+            popped = values[-count:]
+            del values[-count:]
+            return popped
+
+    def patch_target(self, model):
+        # Rows in turn, so concurrent patches rarely share a row.
+        with self.lock:
+            ids = self.venue_ids if model is Venue else self.artist_ids
+            entity_id = ids[self.patched[model] % len(ids)]
+            self.patched[model] += 1
+            version = self.versions[model][entity_id]
+            self.versions[model][entity_id] = version + 1
+            return entity_id, version
+
+
+def venue_form(name, fixture):
+    city, state = fixture.choice(CITIES)
+    return {
+        'name': name,
+        'city': city,
+        'state': state,
+        'address': '1 Bench Street',
+        'phone': '555-555-5555',
+        'genres': [fixture.choice(GENRES)],
+        'facebook_link': 'https://www.facebook.com/bench',
+        'image_link': 'https://images.example.com/bench.jpg',
+        'website_link': 'https://bench.example.com',
+        'seeking_description': '',
+    }
+
+
+def artist_form(name, fixture):
+    city, state = fixture.choice(CITIES)
+    return {
+        'name': name,
+        'city': city,
+        'state': state,
+        'phone': '555-555-5555',
+        'genres': [fixture.choice(GENRES)],
+        'facebook_link': 'https://www.facebook.com/bench',
+        'image_link': 'https://images.example.com/bench.jpg',
+        'website_link': 'https://bench.example.com',
+        'seeking_description': '',
+    }
+
+
+def patch_request(model, fixture):
+    entity_id, version = fixture.patch_target(model)
+    return ('PATCH', f'/{model.__tablename__}/{entity_id}', JSONBody(
+        version=version,
+        changes={'name': f'Patched {model.__name__} {fixture.next_number()}'}))
+
+
+def bulk_patch_request(model, fixture):
+    updates = []
+    for _ in range(BULK_UPDATE_SIZE):
+        entity_id, version = fixture.patch_target(model)
+        updates.append({'id': entity_id, 'version': version, 'changes': {
+            'name': f'Patched {model.__name__} {fixture.next_number()}'}})
+    return ('PATCH', f'/{model.__tablename__}', JSONBody(updates=updates))
+
+
+def show_form(fixture):
+    # Each show gets its own two hour slot, past the generated schedule, so
+    # the scenario measures successful bookings rather than conflicts.
+    start_time = SHOW_SLOTS_START + timedelta(hours=2 * fixture.next_number())
+    return {
+        'venue_id': fixture.choice(fixture.venue_ids),
+        'artist_id': fixture.choice(fixture.artist_ids),
+        'start_time': start_time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+# Each scenario returns (method, path, form data or JSONBody) for one
+# request. Reads come first; writes and deletes run afterwards in the order
+# listed. The delete scenarios only remove rows the create scenarios added,
+# and the bulk deletes rows added for them just before they run.
+SCENARIOS = [
+    ('index', lambda f: ('GET', '/', None)),
+    ('venues', lambda f: ('GET', '/venues', None)),
+    ('venues_next_page', lambda f: (
+        'GET', f'/venues?after={f.choice(f.venue_cursors)}', None)),
+    ('venues_genre_facet', lambda f: (
+        'GET', f'/venues?genre={f.choice(GENRES)}', None)),
+    ('venues_city_facet', lambda f: (
+        'GET', '/venues?city={}&state={}'.format(*f.choice(CITIES)), None)),
+    ('search_venues', lambda f: (
+        'GET', '/venues/search?search_term=' + f.choice(['hall', 'blue']),
+        None)),
+    ('search_venues_form', lambda f: (
+        'POST', '/venues/search',
+        {'search_term': f.choice(['hall', 'blue'])})),
+    ('show_venue', lambda f: (
+        'GET', f'/venues/{f.choice(f.venue_ids)}', None)),
+    ('venues_nearby', lambda f: (
+        'GET', '/venues/nearby?lat={}&lng={}&radius=10'.format(
+            *CITY_LOCATIONS[f.choice(CITIES)[0]]), None)),
+    ('venue_matches', lambda f: (
+        'GET', f'/venues/{f.choice(f.venue_ids)}/matches', None)),
+    ('edit_venue', lambda f: (
+        'GET', f'/venues/{f.choice(f.venue_ids)}/edit', None)),
+    ('artists', lambda f: ('GET', '/artists', None)),
+    ('artists_next_page', lambda f: (
+        'GET', f'/artists?after={f.choice(f.artist_cursors)}', None)),
+    ('artists_genre_facet', lambda f: (
+        'GET', f'/artists?genre={f.choice(GENRES)}', None)),
+    ('search_artists', lambda f: (
+        'GET', '/artists/search?search_term=' + f.choice(['guns', 'wolves']),
+        None)),
+    ('search_artists_form', lambda f: (
+        'POST', '/artists/search',
+        {'search_term': f.choice(['guns', 'wolves'])})),
+    ('show_artist', lambda f: (
+        'GET', f'/artists/{f.choice(f.artist_ids)}', None)),
+    ('artist_matches', lambda f: (
+        'GET', f'/artists/{f.choice(f.artist_ids)}/matches', None)),
+    ('edit_artist', lambda f: (
+        'GET', f'/artists/{f.choice(f.artist_ids)}/edit', None)),
+    ('shows', lambda f: ('GET', '/shows', None)),
+    ('shows_next_page', lambda f: (
+        'GET', f'/shows?after={f.choice(f.show_cursors)}', None)),
+    ('image', lambda f: (
+        'GET', f'/images/{f.choice(["tile", "detail"])}/{f.image_token}',
+        None)),
+    ('create_venue_form', lambda f: ('GET', '/venues/create', None)),
+    ('create_artist_form', lambda f: ('GET', '/artists/create', None)),
+    ('create_show_form', lambda f: ('GET', '/shows/create', None)),
+    ('export_venue_shows', lambda f: (
+        'GET', f'/export/shows.csv?venue_id={f.choice(f.venue_ids)}', None)),
+    ('export_venues', lambda f: ('GET', '/export/venues.csv', None)),
+    ('export_artists', lambda f: ('GET', '/export/artists.ndjson', None)),
+    ('asset', lambda f: ('GET', f'/assets/{f.choice(f.assets)}', None)),
+    ('cache_stats', lambda f: ('GET', '/cache/stats', None)),
+    ('pool_stats', lambda f: ('GET', '/pool/stats', None)),
+    ('metrics', lambda f: ('GET', '/metrics', None)),
+    ('create_venue', lambda f: (
+        'POST', '/venues/create',
+        venue_form(f'{BENCH_PREFIX} Venue {f.next_number()}', f))),
+    ('create_artist', lambda f: (
+        'POST', '/artists/create',
+        artist_form(f'{BENCH_PREFIX} Artist {f.next_number()}', f))),
+    ('create_show', lambda f: ('POST', '/shows/create', show_form(f))),
+    ('patch_venue', lambda f: patch_request(Venue, f)),
+    ('patch_artist', lambda f: patch_request(Artist, f)),
+    ('patch_venues', lambda f: bulk_patch_request(Venue, f)),
+    ('patch_artists', lambda f: bulk_patch_request(Artist, f)),
+    ('edit_venue_submission', lambda f: (
+        'POST', f'/venues/{f.choice(f.venue_ids)}/edit',
+        venue_form(f'Edited Venue {f.next_number()}', f))),
+    ('edit_artist_submission', lambda f: (
+        'POST', f'/artists/{f.choice(f.artist_ids)}/edit',
+        artist_form(f'Edited Artist {f.next_number()}', f))),
+    ('delete_venue', lambda f: (
+        'DELETE', f'/venues/{f.pop(f.created_venues)}', None)),
+    ('delete_artist', lambda f: (
+        'DELETE', f'/artists/{f.pop(f.created_artists)}', None)),
+    ('bulk_delete_venues', lambda f: (
+        'POST', '/venues/delete',
+        JSONBody(ids=f.pop_many(f.created_venues, BULK_DELETE_SIZE)))),
+    ('bulk_delete_artists', lambda f: (
+        'POST', '/artists/delete',
+        JSONBody(ids=f.pop_many(f.created_artists, BULK_DELETE_SIZE)))),
+]
+
+
+_last_request = threading.local()
+
+
+def _record_query_count(response):
+    # The metrics hooks count statements in g.sql_count; expose the count
+    # to the harness without going through /metrics. A streamed body (the
+    # exports) runs its statements after the header is set, so the harness
+    # also keeps g and reads the count once it has read the body.
+    from flask import g
+    response.headers['X-SQL-Count'] = str(g.get('sql_count', 0))
+    _last_request.g = g._get_current_object()
+    return response
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1,
+                max(0, int(round(percent / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run_scenario(scenario, fixture, requests, concurrency, cold):
+    local = threading.local()
+
+    def one_request(_):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        if cold:
+            cache.clear()
+            fragments.clear()
+        method, path, data = scenario(fixture)
+        body = {'json': data} if isinstance(data, JSONBody) \
+            else {'data': data}
+        started = time.perf_counter()
+        response = client.open(path, method=method, **body)
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        response.close()
+        return (elapsed, _last_request.g.get('sql_count', 0),
+                response.status_code)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(one_request, range(requests)))
+    return summarize(samples, time.perf_counter() - started)
+
+
+def summarize(samples, wall):
+    # samples are (seconds, SQL statements, status code) per request.
+    latencies = [elapsed for elapsed, queries, status in samples]
+    statuses = {}
+    for elapsed, queries, status in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(samples),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'throughput_rps': round(len(samples) / wall, 1) if wall else None,
+        'queries_per_request': round(statistics.fmean(
+            queries for elapsed, queries, status in samples), 2),
+        'statuses': statuses,
+    }
+
+
+def _created_ids(model):
+    return [row_id for row_id, in db.session.query(model.id)
+            .filter(model.name.like(f'{BENCH_PREFIX} %'))
+            .order_by(model.id)]
+
+
+def _add_bench_rows(model, fixture, count):
+    # Rows for the bulk deletes, which need more than the creates add.
+    form = venue_form if model is Venue else artist_form
+    rows = [model(**form(f'{BENCH_PREFIX} Bulk {model.__name__} '
+                         f'{fixture.next_number()}', fixture))
+            for _ in range(count)]
+    db.session.add_all(rows)
+    db.session.commit()
+    ids = [row.id for row in rows]
+    db.session.remove()
+    return ids
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_database(shows, seed, batch_size):
+    db.drop_all()
+    db.create_all()
+    started = time.perf_counter()
+    counts = generate(db.session, shows=shows, seed=seed,
+                      batch_size=batch_size)
+    counts['load_seconds'] = round(time.perf_counter() - started, 2)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', default='10k',
+                        help='number of shows to generate, e.g. 10k, 100k, 1M')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=200,
+                        help='requests sent to each route')
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--cold-cache', action='store_true',
+                        help='clear the cache before every request')
+    parser.add_argument('--reuse-data', action='store_true',
+                        help='keep the rows already in the database')
+    parser.add_argument('--routes', help='comma separated scenario names')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('-o', '--output', help='results file')
+    args = parser.parse_args(argv)
+
+    shows = parse_scale(args.scale)
+    app.config['WTF_CSRF_ENABLED'] = False
+    app.after_request(_record_query_count)
+    selected = set(args.routes.split(',')) if args.routes else None
+
+    # The asset scenario needs a build; without one, build into a scratch
+    # directory rather than static/.
+    assets_dir = None
+    if not app.extensions['assets']:
+        assets_dir = tempfile.mkdtemp(prefix='fyyur-assets-')
+        app.config['ASSETS_DIR'] = assets_dir
+        build_assets(app)
+
+    with app.app_context():
+        if args.reuse_data:
+            data = {'reused': True}
+        else:
+            print(f'Generating {shows} shows (seed {args.seed})...',
+                  file=sys.stderr)
+            data = prepare_database(shows, args.seed, args.batch_size)
+        fixture = Fixture(args.seed)
+        db.session.remove()
+
+        routes = {}
+        for name, scenario in SCENARIOS:
+            if selected is not None and name not in selected:
+                continue
+            if name.startswith('delete_'):
+                fixture.created_venues = _created_ids(Venue)
+                fixture.created_artists = _created_ids(Artist)
+                db.session.remove()
+                available = len(fixture.created_venues
+                                if name == 'delete_venue'
+                                else fixture.created_artists)
+                requests = min(args.requests, available)
+                if not requests:
+                    continue
+            elif name.startswith('bulk_delete_'):
+                requests = args.requests
+                if name == 'bulk_delete_venues':
+                    fixture.created_venues = _add_bench_rows(
+                        Venue, fixture, requests * BULK_DELETE_SIZE)
+                else:
+                    fixture.created_artists = _add_bench_rows(
+                        Artist, fixture, requests * BULK_DELETE_SIZE)
+            else:
+                requests = args.requests
+            routes[name] = run_scenario(scenario, fixture, requests,
+                                        args.concurrency, args.cold_cache)
+            result = routes[name]
+            print(f'{name:<24} p50 {result["p50_ms"]:9.2f}ms '
+                  f'p95 {result["p95_ms"]:9.2f}ms '
+                  f'p99 {result["p99_ms"]:9.2f}ms '
+                  f'{result["throughput_rps"]:9.1f} req/s '
+                  f'{result["queries_per_request"]:6.2f} queries')
+        dialect = db.engine.dialect.name
+    if assets_dir is not None:
+        shutil.rmtree(assets_dir)
+
+    report = {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'revision': _git_revision(),
+        'database': dialect,
+        'scale': shows,
+        'seed': args.seed,
+        'requests_per_route': args.requests,
+        'concurrency': args.concurrency,
+        'cold_cache': args.cold_cache,
+        'data': data,
+        'routes': routes,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f'{stamp}-{args.scale}.json')
+    with open(output, 'w') as results:
+        json.dump(report, results, indent=2)
+    print(f'Results written to {output}', file=sys.stderr)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""Compare the read routes served by the WSGI app and by the ASGI app.
+
+Run with ``python -m benchmarks.serving --concurrency 64 --workers 8``. Both
+modes get the same number of concurrent clients, driven in-process like
+``benchmarks.harness``: WSGI requests are served by a pool of ``--workers``
+threads, as by a threaded WSGI server, so clients beyond that wait for a
+thread, while ASGI requests all run on one event loop with async sessions.
+Latencies include that wait. Point TEST_DATABASE_URL at PostgreSQL for
+meaningful numbers; the async side needs asyncpg (aiosqlite for SQLite).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import unquote
+
+os.environ.setdefault('FYYUR_ENV', 'testing')
+
+from benchmarks.datagen import parse_scale  # noqa
+from benchmarks.harness import (  # noqa
+    RESULTS_DIR,
+    SCENARIOS,
+    Fixture,
+    _git_revision,
+    _record_query_count,
+    prepare_database,
+    summarize
+)
+from app import app, cache, fragments, READ_VIEWS  # noqa
+from asgi import AsyncReadApp  # noqa
+from models import db  # noqa
+
+READ_SCENARIOS = (
+    'venues', 'venues_genre_facet', 'venues_city_facet', 'search_venues',
+    'show_venue', 'venues_nearby', 'venue_matches', 'artists',
+    'artists_genre_facet', 'search_artists', 'show_artist', 'artist_matches',
+    'shows',
+)
+
+
+def wsgi_caller(executor):
+    local = threading.local()
+
+    def request(method, path):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        response = client.open(path, method=method)
+        response.get_data()
+        response.close()
+        return (response.status_code,
+                int(response.headers.get('X-SQL-Count', 0)))
+
+    async def call(method, path):
+        return await asyncio.get_running_loop().run_in_executor(
+            executor, request, method, path)
+    return call
+
+
+def asgi_caller(application):
+    async def call(method, path):
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': unquote(path),
+            'raw_path': path.encode(),
+            'query_string': query.encode(),
+            'root_path': '',
+            'headers': [(b'host', b'localhost')],
+            'client': ('127.0.0.1', 0),
+            'server': ('localhost', 80),
+        }
+        response = {}
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = dict(message['headers'])
+
+        await application(scope, receive, send)
+        return (response['status'],
+                int(response['headers'].get(b'x-sql-count', 0)))
+    return call
+
+
+async def drive(call, scenario, fixture, requests, concurrency):
+    clients = asyncio.Semaphore(concurrency)
+
+    async def one_request():
+        async with clients:
+            method, path, data = scenario(fixture)
+            started = time.perf_counter()
+            status, queries = await call(method, path)
+            return time.perf_counter() - started, queries, status
+
+    started = time.perf_counter()
+    samples = await asyncio.gather(*(one_request()
+                                     for _ in range(requests)))
+    return summarize(samples, time.perf_counter() - started)
+
+
+async def compare(scenarios, fixture, requests, concurrency, workers):
+    application = AsyncReadApp(app, READ_VIEWS)
+    await application.startup()
+    modes = {'wsgi': {}, 'asgi': {}}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        callers = {'wsgi': wsgi_caller(executor),
+                   'asgi': asgi_caller(application)}
+        for name, scenario in scenarios:
+            for mode, call in callers.items():
+                cache.clear()
+                fragments.clear()
+                modes[mode][name] = await drive(call, scenario, fixture,
+                                                requests, concurrency)
+            wsgi, asgi = modes['wsgi'][name], modes['asgi'][name]
+            print(f'{name:<22} '
+                  f'wsgi {wsgi["throughput_rps"]:8.1f} req/s '
+                  f'p95 {wsgi["p95_ms"]:8.2f}ms   '
+                  f'asgi {asgi["throughput_rps"]:8.1f} req/s '
+                  f'p95 {asgi["p95_ms"]:8.2f}ms   '
+                  f'x{asgi["throughput_rps"] / wsgi["throughput_rps"]:.2f}')
+    await application.shutdown()
+    return modes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', default='10k',
+                        help='number of shows to generate, e.g. 10k, 100k, 1M')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--requests', type=int, default=500,
+                        help='requests sent to each route in each mode')
+    parser.add_argument('--concurrency', type=int, default=64,
+                        help='concurrent clients')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='threads serving the WSGI app')
+    parser.add_argument('--reuse-data', action='store_true',
+                        help='keep the rows already in the database')
+    parser.add_argument('--routes', help='comma separated scenario names')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('-o', '--output', help='results file')
+    args = parser.parse_args(argv)
+
+    shows = parse_scale(args.scale)
+    app.after_request(_record_query_count)
+    selected = set(args.routes.split(',')) if args.routes \
+        else set(READ_SCENARIOS)
+    scenarios = [(name, scenario) for name, scenario in SCENARIOS
+                 if name in READ_SCENARIOS and name in selected]
+
+    with app.app_context():
+        if args.reuse_data:
+            data = {'reused': True}
+        else:
+            print(f'Generating {shows} shows (seed {args.seed})...',
+                  file=sys.stderr)
+            data = prepare_database(shows, args.seed, args.batch_size)
+        fixture = Fixture(args.seed)
+        dialect = db.engine.dialect.name
+        db.session.remove()
+
+    modes = asyncio.run(compare(scenarios, fixture, args.requests,
+                                args.concurrency, args.workers))
+
+    report = {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'revision': _git_revision(),
+        'database': dialect,
+        'scale': shows,
+        'seed': args.seed,
+        'requests_per_route': args.requests,
+        'concurrency': args.concurrency,
+        'wsgi_workers': args.workers,
+        'engine_options': {
+            'wsgi': repr(app.config['SQLALCHEMY_ENGINE_OPTIONS']),
+            'asgi': repr(app.config['ASYNC_ENGINE_OPTIONS']),
+        },
+        'data': data,
+        'modes': modes,
+    }
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR,
+                              f'{stamp}-{args.scale}-serving.json')
+    with open(output, 'w') as results:
+        json.dump(report, results, indent=2)
+    print(f'Results written to {output}', file=sys.stderr)
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # the shared backend is optional
+    redis = None
+
+MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe in-process cache with a size bound and per-entry TTL."""
+
+    def __init__(self, maxsize=1024, ttl=30, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            value, expires_at = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class LocalSharedCache(LRUCache):
+    # Stands in for the shared backend in tests and single-process runs.
+
+    def __init__(self, ttl=300, clock=time.monotonic):
+        super().__init__(maxsize=float('inf'), ttl=ttl, clock=clock)
+
+
+class RedisCache:
+    def __init__(self, url, ttl=300, prefix='fyyur:'):
+        if redis is None:
+            raise RuntimeError('CACHE_SHARED_URL is set but the redis '
+                               'package is not installed')
+        self.ttl = ttl
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._client.get(self.prefix + key)
+        return MISSING if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self._client.set(self.prefix + key, pickle.dumps(value),
+                         ex=self.ttl if ttl is None else ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            self._client.delete(key)
+
+
+class Cache:
+    """Read-through cache: an in-process LRU in front of an optional
+    shared backend.
+
+    Keys that cover many entries (such as every page of a listing) are
+    namespaced by a generation token, so bumping the token invalidates all
+    of them at once.
+    """
+
+    def __init__(self, app=None, shared=None, local=None):
+        self.local = local
+        self.shared = shared
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        if self.local is None:
+            self.local = LRUCache(maxsize=app.config['CACHE_LOCAL_SIZE'],
+                                  ttl=app.config['CACHE_LOCAL_TTL'])
+        if self.shared is None:
+            if app.config['CACHE_SHARED_BACKEND'] == 'local':
+                self.shared = LocalSharedCache(
+                    ttl=app.config['CACHE_SHARED_TTL'])
+            elif app.config['CACHE_SHARED_URL']:
+                self.shared = RedisCache(app.config['CACHE_SHARED_URL'],
+                                         ttl=app.config['CACHE_SHARED_TTL'])
+        app.extensions['cache'] = self
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _lookup(self, key):
+        value = self.local.get(key)
+        if value is MISSING and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not MISSING:
+                self.local.set(key, value)
+        return value
+
+    def _store(self, key, value, ttl=None):
+        self.local.set(key, value, ttl)
+        if self.shared is not None:
+            self.shared.set(key, value, ttl)
+
+    def get_or_set(self, key, loader, ttl=None):
+        value = self._lookup(key)
+        self._count(value is not MISSING)
+        if value is MISSING:
+            value = loader()
+            # None marks a missing row; caching it would hide later inserts.
+            if value is not None:
+                self._store(key, value, ttl)
+        return value
+
+    def delete(self, *keys):
+        self.local.delete(*keys)
+        if self.shared is not None:
+            self.shared.delete(*keys)
+
+    def generation(self, namespace):
+        key = namespace + ':generation'
+        token = self._lookup(key)
+        if token is MISSING:
+            token = uuid.uuid4().hex
+            self._store(key, token)
+        return token
+
+    def bump(self, namespace):
+        self.delete(namespace + ':generation')
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'local_entries': len(self.local),
+        }
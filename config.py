@@ -1,12 +1,211 @@
 import os
-SECRET_KEY = os.urandom(32)
+import tempfile
+
+from sqlalchemy.pool import StaticPool
+
+from pooling import InstrumentedQueuePool
+
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
 
-# Connect to the database
-SQLALCHEMY_DATABASE_URI = 'postgresql://postgres@localhost:5432/fyyur'
-SQLALCHEMY_TRACK_MODIFICATIONS = False
-SQLALCHEMY_ECHO = True
+class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
+    DEBUG = False
+
+    # Connect to the database
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'DATABASE_URL', 'postgresql://postgres@localhost:5432/fyyur')
+    # Read replicas, as a comma separated DATABASE_REPLICA_URLS; see
+    # routing.py. A client reads from the primary for REPLICA_STICKY_SECONDS
+    # after it wrote, which should exceed the usual replication lag.
+    SQLALCHEMY_REPLICA_URIS = [
+        url for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',')
+        if url]
+    REPLICA_STICKY_SECONDS = 5
+    REPLICA_CHECK_INTERVAL = 10
+    REPLICA_MAX_LAG_SECONDS = 5
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ECHO = False
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': 5,
+        'max_overflow': 5,
+        'pool_timeout': 10,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+    }
+
+    # ASGI mode (asgi.py) serves the read-only views on async sessions over
+    # ASYNC_DATABASE_URL, which defaults to SQLALCHEMY_DATABASE_URI with the
+    # asyncpg driver. One worker process runs many requests at once, so its
+    # pool is larger than a threaded worker's.
+    ASYNC_DATABASE_URI = os.environ.get('ASYNC_DATABASE_URL')
+    ASYNC_ENGINE_OPTIONS = {
+        'pool_size': 20,
+        'max_overflow': 10,
+        'pool_timeout': 10,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+    }
+
+    # Number of rows per page on the venue, artist and show listings
+    PAGE_SIZE = 20
+
+    # Name search: 'auto' uses the pg_trgm index on PostgreSQL and an
+    # in-memory n-gram index elsewhere; 'trigram' or 'ngram' force one
+    # backend.
+    SEARCH_BACKEND = 'auto'
+    SEARCH_RESULT_LIMIT = 50
+    # Minimum share of the search term's trigrams a name must contain;
+    # set as pg_trgm.word_similarity_threshold for each search on PostgreSQL.
+    SEARCH_SIMILARITY_THRESHOLD = 0.6
+
+    # Most ids accepted by one POST /venues/delete or /artists/delete, and
+    # most updates by one PATCH /venues or /artists.
+    BULK_DELETE_LIMIT = 10000
+    BULK_UPDATE_LIMIT = 1000
+
+    # /venues/nearby: default and largest search radius and result count.
+    NEARBY_RADIUS_KM = 25
+    NEARBY_MAX_RADIUS_KM = 500
+    NEARBY_LIMIT = 10
+    NEARBY_MAX_LIMIT = 100
+
+    # Artist and venue matches score the share of genres in common (0 to
+    # 1) plus a boost for the same city, or else the same state. Writes by
+    # other processes reach a process's match index within MATCH_INDEX_TTL
+    # seconds.
+    MATCH_LIMIT = 10
+    MATCH_MAX_LIMIT = 100
+    MATCH_CITY_BOOST = 0.5
+    MATCH_STATE_BOOST = 0.2
+    MATCH_INDEX_TTL = 300
+
+    # Detail page and show listing cache. Entries live in a per-process LRU
+    # and, when CACHE_SHARED_URL points at a Redis server, in a cache shared
+    # by all workers. Writes invalidate both, but other workers' LRUs can
+    # serve a stale entry for up to CACHE_LOCAL_TTL seconds.
+    # CACHE_SHARED_BACKEND 'local' swaps Redis for an in-process stand-in.
+    CACHE_LOCAL_SIZE = 1024
+    CACHE_LOCAL_TTL = 30
+    CACHE_SHARED_BACKEND = os.environ.get('CACHE_SHARED_BACKEND', 'redis')
+    CACHE_SHARED_URL = os.environ.get('CACHE_SHARED_URL')
+    CACHE_SHARED_TTL = 300
+
+    # Compiled templates are kept on disk so new workers skip compiling
+    # them, and every template is loaded at startup. Listing tiles are
+    # cached as rendered fragments keyed on the entity's id and version, in
+    # a per-process LRU separate from the detail page cache.
+    TEMPLATE_BYTECODE_DIR = os.environ.get(
+        'TEMPLATE_BYTECODE_DIR', os.path.join(basedir, '.jinja_cache'))
+    TEMPLATE_PRECOMPILE = True
+    TEMPLATE_FRAGMENT_CACHE = True
+    TEMPLATE_FRAGMENT_CACHE_SIZE = 4096
+    TEMPLATE_FRAGMENT_TTL = 3600
+
+    # Output of `flask assets build`, served under ASSETS_URL_PATH with
+    # immutable cache headers.
+    ASSETS_DIR = os.path.join(basedir, 'static', 'dist')
+    ASSETS_URL_PATH = '/assets'
+    ASSETS_MAX_AGE = 365 * 24 * 3600
+
+    # Image proxy: venue and artist images are fetched once, resized and
+    # kept in IMAGE_CACHE_DIR, which is held under IMAGE_CACHE_MAX_BYTES by
+    # evicting the least recently served files. IMAGE_FETCHER 'local' reads
+    # sources from IMAGE_LOCAL_DIR instead of the network.
+    IMAGE_FETCHER = os.environ.get('IMAGE_FETCHER', 'url')
+    IMAGE_LOCAL_DIR = os.path.join(basedir, 'static', 'img')
+    IMAGE_FETCH_TIMEOUT = 5
+    IMAGE_MAX_SOURCE_BYTES = 10 * 1024 * 1024
+    IMAGE_CACHE_DIR = os.environ.get(
+        'IMAGE_CACHE_DIR', os.path.join(basedir, '.image_cache'))
+    IMAGE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+    IMAGE_WORKERS = 4
+    # Requests wait this long for a new thumbnail before being redirected
+    # to the source image.
+    IMAGE_WAIT_SECONDS = 3
+    IMAGE_MAX_AGE = 7 * 24 * 3600
+
+    # Requests slower than this are logged with the SQL they ran.
+    SLOW_REQUEST_SECONDS = 0.5
+
+    # JSON log lines, rotated at midnight or once the file reaches
+    # LOG_MAX_BYTES, whichever comes first.
+    LOG_FILE = os.environ.get('LOG_FILE', os.path.join(basedir, 'error.log'))
+    LOG_LEVEL = 'INFO'
+    LOG_MAX_BYTES = 10 * 1024 * 1024
+    LOG_ROTATE_WHEN = 'midnight'
+    LOG_BACKUP_COUNT = 14
+
+
+class DevelopmentConfig(Config):
+    # Edited templates would otherwise keep serving old fragments.
+    TEMPLATE_FRAGMENT_CACHE = False
+    # Enable debug mode and log every SQL statement.
+    DEBUG = True
+    SQLALCHEMY_ECHO = True
+
+
+class TestingConfig(Config):
+    TESTING = True
+    IMAGE_FETCHER = 'local'
+    CACHE_SHARED_BACKEND = 'local'
+    # Tests and benchmarks log outside the source tree.
+    LOG_FILE = os.environ.get(
+        'LOG_FILE', os.path.join(tempfile.gettempdir(), 'fyyur-testing.log'))
+    # An in-memory SQLite database unless TEST_DATABASE_URL points elsewhere.
+    SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL', 'sqlite://')
+    if SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        # One shared connection, so every thread sees the same in-memory
+        # database.
+        SQLALCHEMY_ENGINE_OPTIONS = {
+            'poolclass': StaticPool,
+            'connect_args': {'check_same_thread': False},
+        }
+        ASYNC_ENGINE_OPTIONS = {}
+
+
+class ProductionConfig(Config):
+    # Size the pool so that workers x (pool_size + max_overflow) stays below
+    # the server's max_connections; the saturation and checkout wait numbers
+    # from pooling.pool_stats show when it is too small.
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': 5,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+        # Abort runaway queries on the server instead of holding a worker.
+        'connect_args': {'options': '-c statement_timeout={}'.format(
+            os.environ.get('DB_STATEMENT_TIMEOUT_MS', 5000))},
+    }
+    ASYNC_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('ASYNC_DB_POOL_SIZE', 20)),
+        'max_overflow': int(os.environ.get('ASYNC_DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': 5,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+        'connect_args': {'server_settings': {
+            'statement_timeout': os.environ.get('DB_STATEMENT_TIMEOUT_MS',
+                                                '5000')}},
+    }
+
+
+PROFILES = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
+
+
+def get_config(name=None):
+    name = name or os.environ.get('FYYUR_ENV', 'development')
+    if name not in PROFILES:
+        raise RuntimeError(f'Unknown FYYUR_ENV {name!r}; '
+                           f'expected one of {", ".join(PROFILES)}')
+    if name == 'production' and not os.environ.get('SECRET_KEY'):
+        # A per-process random key breaks sessions across workers.
+        raise RuntimeError('SECRET_KEY must be set in production')
+    return PROFILES[name]
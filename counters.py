@@ -0,0 +1,129 @@
+"""Upcoming and past show counts stored on the venue and artist rows.
+
+Shows added, moved or removed through the ORM adjust the counts as they are
+flushed. A show stays counted as upcoming (``Show.counted_upcoming``) until
+``roll`` moves it to the past, so ``flask shows roll`` has to run
+periodically; listings are as fresh as the last roll. Bulk loads that bypass
+the ORM call ``recount`` afterwards, and set-based deletes call ``uncount``
+before their shows are cascaded away.
+"""
+from datetime import datetime
+
+from sqlalchemy import event, false, func, inspect, select, update
+
+from models import Venue, Artist, Show
+
+# (owner model, foreign key on shows) for each side of a show.
+OWNERS = ((Venue, Show.venue_id), (Artist, Show.artist_id))
+
+
+def _adjust(connection, model, owner_id, upcoming, change):
+    column = 'upcoming_shows_count' if upcoming else 'past_shows_count'
+    table = model.__table__
+    connection.execute(
+        update(table)
+        .where(table.c.id == owner_id)
+        .values({column: table.c[column] + change}))
+
+
+def _count(connection, venue_id, artist_id, upcoming, change):
+    _adjust(connection, Venue, venue_id, upcoming, change)
+    _adjust(connection, Artist, artist_id, upcoming, change)
+
+
+@event.listens_for(Show, 'before_insert')
+def _classify_show(mapper, connection, show):
+    show.counted_upcoming = show.start_time >= datetime.now()
+
+
+@event.listens_for(Show, 'after_insert')
+def _count_new_show(mapper, connection, show):
+    _count(connection, show.venue_id, show.artist_id,
+           show.counted_upcoming, 1)
+
+
+@event.listens_for(Show, 'after_delete')
+def _uncount_deleted_show(mapper, connection, show):
+    _count(connection, show.venue_id, show.artist_id,
+           show.counted_upcoming, -1)
+
+
+@event.listens_for(Show, 'before_update')
+def _recount_moved_show(mapper, connection, show):
+    state = inspect(show)
+    changed = {name: state.attrs[name].history
+               for name in ('venue_id', 'artist_id', 'start_time')}
+    if not any(history.has_changes() for history in changed.values()):
+        return
+
+    def old(name):
+        history = changed[name]
+        return history.deleted[0] if history.deleted else getattr(show, name)
+
+    _count(connection, old('venue_id'), old('artist_id'),
+           show.counted_upcoming, -1)
+    show.counted_upcoming = show.start_time >= datetime.now()
+    _count(connection, show.venue_id, show.artist_id,
+           show.counted_upcoming, 1)
+
+
+def roll(session, now=None):
+    """Move shows that have started since the last roll from the upcoming
+    to the past counts; returns the number of shows moved."""
+    now = now or datetime.now()
+    rolled = (Show.counted_upcoming, Show.start_time < now)
+    for model, foreign_key in OWNERS:
+        moved = select(func.count()).where(
+            foreign_key == model.id, *rolled).scalar_subquery()
+        session.execute(
+            update(model)
+            .where(model.id.in_(select(foreign_key).where(*rolled)))
+            .values(upcoming_shows_count=model.upcoming_shows_count - moved,
+                    past_shows_count=model.past_shows_count + moved),
+            execution_options={'synchronize_session': False})
+    result = session.execute(
+        update(Show).where(*rolled).values(counted_upcoming=false()),
+        execution_options={'synchronize_session': False})
+    session.commit()
+    return result.rowcount
+
+
+def uncount(session, foreign_key, ids):
+    """Remove the shows whose ``foreign_key`` is in ``ids`` from the counts
+    of their venues or artists on the other side."""
+    removed = (foreign_key.in_(ids),)
+    for model, other_key in OWNERS:
+        if other_key is foreign_key:
+            continue
+
+        def count(*criteria):
+            return select(func.count()).where(
+                other_key == model.id, *removed, *criteria).scalar_subquery()
+
+        session.execute(
+            update(model)
+            .where(model.id.in_(select(other_key).where(*removed)))
+            .values(upcoming_shows_count=model.upcoming_shows_count -
+                    count(Show.counted_upcoming),
+                    past_shows_count=model.past_shows_count -
+                    count(~Show.counted_upcoming)),
+            execution_options={'synchronize_session': False})
+
+
+def recount(session, now=None):
+    """Recompute every count from the shows table."""
+    now = now or datetime.now()
+    session.execute(
+        update(Show).values(counted_upcoming=Show.start_time >= now),
+        execution_options={'synchronize_session': False})
+    for model, foreign_key in OWNERS:
+        def count(*criteria):
+            return select(func.count()).where(
+                foreign_key == model.id, *criteria).scalar_subquery()
+
+        session.execute(
+            update(model).values(
+                upcoming_shows_count=count(Show.counted_upcoming),
+                past_shows_count=count(~Show.counted_upcoming)),
+            execution_options={'synchronize_session': False})
+    session.commit()
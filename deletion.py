@@ -0,0 +1,47 @@
+"""Set-based deletes of venues and artists.
+
+Rows are removed with a single DELETE and their shows follow through the
+``ON DELETE CASCADE`` foreign keys, so neither is loaded into Python. The
+counts on the other side of the removed shows are adjusted first, since the
+cascade bypasses the ORM events in counters.py.
+"""
+from collections import namedtuple
+
+from sqlalchemy import delete, select
+
+from counters import uncount
+from models import Venue, Artist, Show
+
+# (foreign key of the deleted side, foreign key of the other side)
+SHOW_KEYS = {
+    Venue: (Show.venue_id, Show.artist_id),
+    Artist: (Show.artist_id, Show.venue_id),
+}
+
+Deleted = namedtuple('Deleted', 'names related_ids')
+
+
+def delete_entities(session, model, ids):
+    """Delete the venues or artists with ``ids`` and their shows without
+    committing.
+
+    Returns the deleted names by id, and the ids of the artists or venues
+    that had shows with them, whose cached pages are now stale. Ids that
+    do not exist are ignored.
+    """
+    foreign_key, other_key = SHOW_KEYS[model]
+    # Locking the rows keeps shows from being booked on them until the
+    # transaction ends, so the counts adjusted below stay exact.
+    ids = session.scalars(
+        select(model.id).where(model.id.in_(set(ids)))
+        .order_by(model.id).with_for_update()).all()
+    if not ids:
+        return Deleted({}, [])
+
+    related_ids = session.scalars(
+        select(other_key).where(foreign_key.in_(ids)).distinct()).all()
+    uncount(session, foreign_key, ids)
+    names = dict(session.execute(
+        delete(model).where(model.id.in_(ids))
+        .returning(model.id, model.name)).all())
+    return Deleted(names, related_ids)
@@ -0,0 +1,113 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from sqlalchemy import select
+
+from models import Venue, Artist, Show
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def export_statement(kind, filters):
+    if kind == 'venues':
+        return select(*Venue.__table__.columns).order_by(Venue.id)
+    if kind == 'artists':
+        return select(*Artist.__table__.columns).order_by(Artist.id)
+
+    statement = select(
+        Show.id,
+        Show.start_time,
+        Show.end_time,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name')
+    ).join(Venue).join(Artist)
+    if filters.get('start'):
+        statement = statement.where(Show.start_time >= filters['start'])
+    if filters.get('end'):
+        statement = statement.where(Show.start_time < filters['end'])
+    if filters.get('venue_id'):
+        statement = statement.where(Show.venue_id == filters['venue_id'])
+    if filters.get('artist_id'):
+        statement = statement.where(Show.artist_id == filters['artist_id'])
+    return statement.order_by(Show.start_time, Show.id)
+
+
+def parse_export_filters(values):
+    # Raises ValueError on malformed dates or ids.
+    filters = {}
+    for name in ('start', 'end'):
+        if values.get(name):
+            filters[name] = datetime.fromisoformat(values[name])
+    for name in ('venue_id', 'artist_id'):
+        if values.get(name):
+            filters[name] = int(values[name])
+    return filters
+
+
+def stream_rows(session, statement, batch_size=1000):
+    # yield_per fetches through a server-side cursor in fixed-size batches,
+    # so only one batch of rows is held in memory at a time.
+    result = session.execute(
+        statement.execution_options(yield_per=batch_size))
+    for row in result:
+        yield row._mapping
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _csv_value(value):
+    # Booleans as importer.py reads them back.
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, list):
+        return ','.join(value)
+    return _json_value(value)
+
+
+def to_csv(columns, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_csv_value(row[column]) for column in columns])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def to_ndjson(columns, rows):
+    for row in rows:
+        yield json.dumps({column: _json_value(row[column])
+                          for column in columns}) + '\n'
+
+
+def chunked(lines, chunk_size=64 * 1024):
+    # Group lines into larger writes so each WSGI chunk is not a single row.
+    chunk, size = [], 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield ''.join(chunk)
+
+
+def export(session, kind, format, filters=None):
+    statement = export_statement(kind, filters or {})
+    columns = [column.name for column in statement.selected_columns]
+    write = to_csv if format == 'csv' else to_ndjson
+    return chunked(write(columns, stream_rows(session, statement)))
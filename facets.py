@@ -0,0 +1,117 @@
+from collections import Counter
+
+from sqlalchemy import Integer, func, literal, select, true, type_coerce, \
+    union_all
+
+from enums import Genre
+from models import GENRE_BITS
+
+GENRE_LABELS = dict(Genre.choices())
+
+# City and state lists can be long; only the most common values get a link.
+MAX_PLACE_FACETS = 20
+
+
+def parse_facets(values):
+    return {
+        'genre': [genre for genre in values.getlist('genre')
+                  if genre in GENRE_LABELS],
+        'city': values.get('city', '').strip() or None,
+        'state': values.get('state', '').strip() or None,
+    }
+
+
+def facet_filters(model, facets):
+    criteria = []
+    if facets['genre']:
+        # Array containment (@>) is answered by the GIN index on genres on
+        # PostgreSQL.
+        criteria.append(model.genres.contains(facets['genre']))
+    if facets['city']:
+        criteria.append(model.city == facets['city'])
+    if facets['state']:
+        criteria.append(model.state == facets['state'])
+    return criteria
+
+
+def _by_count(item):
+    value, count = item
+    return -count, value or ''
+
+
+def _facet_list(facet, counts):
+    labels = GENRE_LABELS if facet == 'genre' else {}
+    return [(value, labels.get(value, value), count)
+            for value, count in sorted(counts, key=_by_count) if value]
+
+
+def _genre_counts(dialect, filtered):
+    if dialect == 'postgresql':
+        genre = func.unnest(filtered.c.genres) \
+            .table_valued('value').render_derived()
+        return select(
+            literal('genre').label('facet'),
+            genre.c.value,
+            func.count().label('count')
+        ).select_from(filtered).join(genre, true()) \
+            .group_by(genre.c.value)
+
+    # Genres are a bitmask elsewhere: join each row to the genres whose bit
+    # it has set.
+    genre = union_all(*(
+        select(literal(name).label('value'), literal(bit).label('bit'))
+        for name, bit in GENRE_BITS.items()
+    )).cte('genre_bits')
+    mask = type_coerce(filtered.c.genres, Integer())
+    return select(
+        literal('genre').label('facet'),
+        genre.c.value,
+        func.count().label('count')
+    ).select_from(filtered).join(genre, mask.op('&')(genre.c.bit) != 0) \
+        .group_by(genre.c.value)
+
+
+def facet_counts(session, model, facets):
+    """Count genre, city and state values over the filtered rows.
+
+    All three facets come back from a single UNION ALL statement over one
+    scan of the filtered rows.
+    """
+    filtered = select(model.genres, model.city, model.state) \
+        .where(*facet_filters(model, facets)).cte('filtered')
+    genre_counts = _genre_counts(session.connection().dialect.name, filtered)
+
+    def place_counts(name, column):
+        return select(
+            literal(name).label('facet'),
+            column.label('value'),
+            func.count().label('count')
+        ).group_by(column) \
+            .order_by(func.count().desc()) \
+            .limit(MAX_PLACE_FACETS).subquery().select()
+
+    statement = union_all(
+        genre_counts,
+        place_counts('city', filtered.c.city),
+        place_counts('state', filtered.c.state)
+    )
+
+    grouped = {'genre': [], 'city': [], 'state': []}
+    for facet, value, count in session.execute(statement):
+        grouped[facet].append((value, count))
+    return {facet: _facet_list(facet, counts)
+            for facet, counts in grouped.items()}
+
+
+def count_result_facets(results):
+    # Search results are already limited, so they are counted in Python.
+    genres, cities, states = Counter(), Counter(), Counter()
+    for entity in results:
+        genres.update(entity.genres or ())
+        cities[entity.city] += 1
+        states[entity.state] += 1
+    return {
+        'genre': _facet_list('genre', genres.items()),
+        'city': _facet_list('city', cities.most_common(MAX_PLACE_FACETS)),
+        'state': _facet_list('state', states.most_common(MAX_PLACE_FACETS)),
+    }
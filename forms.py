@@ -8,7 +8,8 @@ from wtforms import (
     DateTimeField,
     BooleanField
 )
-from wtforms.validators import DataRequired, AnyOf, URL
+from wtforms.validators import DataRequired, URL, Optional
+from scheduling import DEFAULT_SHOW_DURATION, MAX_SHOW_DURATION
 import re
 
 
@@ -18,6 +19,26 @@ def is_valid_phone(number):
     return regex.match(number)
 
 
+def validate_fields(form, names):
+    """Validate only the fields in ``names``, as partial updates need; the
+    form-wide checks of the venue and artist forms apply to them too."""
+    valid = True
+    for name in names:
+        if not form[name].validate(form):
+            valid = False
+    if 'phone' in names and not form.phone.errors and \
+            not is_valid_phone(form.phone.data):
+        form.phone.errors.append('Invalid phone.')
+        valid = False
+    return valid
+
+
+# The create page's format first (fields render with it), then the ISO 8601
+# forms exporter.py writes, so exported shows import back.
+DATETIME_FORMATS = ['%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S',
+                    '%Y-%m-%dT%H:%M:%S.%f']
+
+
 class ShowForm(Form):
     artist_id = StringField(
         'artist_id'
@@ -27,9 +48,36 @@ class ShowForm(Form):
     )
     start_time = DateTimeField(
         'start_time',
+        format=DATETIME_FORMATS,
         validators=[DataRequired()],
         default=datetime.today()
     )
+    end_time = DateTimeField(
+        'end_time',
+        format=DATETIME_FORMATS,
+        validators=[Optional()]
+    )
+
+    def validate(self):
+        rv = Form.validate(self)
+
+        if not rv:
+            return False
+        for field in (self.artist_id, self.venue_id):
+            if not (field.data or '').strip().isdigit():
+                field.errors.append('Invalid id.')
+                return False
+        if self.end_time.data is None:
+            self.end_time.data = self.start_time.data + DEFAULT_SHOW_DURATION
+        if self.end_time.data <= self.start_time.data:
+            self.end_time.errors.append('End time must be after start time.')
+            return False
+        if self.end_time.data - self.start_time.data > MAX_SHOW_DURATION:
+            self.end_time.errors.append(
+                f'Shows cannot be longer than {MAX_SHOW_DURATION}.')
+            return False
+
+        return True
 
 
 class VenueForm(Form):
@@ -0,0 +1,212 @@
+"""Venue coordinates and nearest venue search.
+
+Venues are located offline by ``flask venues geocode``, which looks their
+address, or failing that their city, up in a local CSV gazetteer. Each
+located venue also stores a geohash: the bits of its longitude and latitude
+interleaved into one integer, so the venues inside any geohash cell are a
+single range of that integer, read from the ``ix_venues_geohash`` index. A
+nearby search reads the cell holding the point and its eight neighbours,
+with cells just large enough to contain the search radius, and ranks those
+candidates by great circle distance. The radius starts small and grows
+until it holds enough venues.
+"""
+import csv
+import heapq
+import math
+
+from sqlalchemy import and_, bindparam, or_, update
+
+from models import Venue
+
+GEOHASH_BITS = 52
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+FIRST_SEARCH_RADIUS_KM = 1
+
+
+def _split(bits):
+    # Longitude gets the odd bit, as in geohash.
+    return (bits + 1) // 2, bits // 2
+
+
+def _cell_index(value, low, high, bits):
+    cells = 1 << bits
+    return min(max(int((value - low) / (high - low) * cells), 0), cells - 1)
+
+
+def _interleave(lng_index, lat_index, bits):
+    lng_bits, lat_bits = _split(bits)
+    value = 0
+    for position in range(bits):
+        if position % 2 == 0:
+            lng_bits -= 1
+            value = value << 1 | lng_index >> lng_bits & 1
+        else:
+            lat_bits -= 1
+            value = value << 1 | lat_index >> lat_bits & 1
+    return value
+
+
+def encode(latitude, longitude, bits=GEOHASH_BITS):
+    lng_bits, lat_bits = _split(bits)
+    return _interleave(_cell_index(longitude, -180, 180, lng_bits),
+                       _cell_index(latitude, -90, 90, lat_bits), bits)
+
+
+def distance_km(latitude1, longitude1, latitude2, longitude2):
+    """Great circle distance by the haversine formula."""
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + \
+        math.cos(phi1) * math.cos(phi2) * \
+        math.sin(math.radians(longitude2 - longitude1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(a), 1.0))
+
+
+def cell_ranges(latitude, longitude, radius_km):
+    """Geohash ranges ``(low, high)``, high excluded, that hold every point
+    within ``radius_km``; None when only the whole world does."""
+    # Pick the smallest cells still radius_km high and, at the poleward
+    # edge of the circle, radius_km wide: the 3 x 3 block of them around
+    # the point then reaches past the circle on every side.
+    edge = min(abs(latitude) + radius_km / KM_PER_DEGREE, 90)
+    width_scale = math.cos(math.radians(edge))
+    for bits in range(GEOHASH_BITS, 1, -1):
+        lng_bits, lat_bits = _split(bits)
+        height = 180 / (1 << lat_bits) * KM_PER_DEGREE
+        width = 360 / (1 << lng_bits) * KM_PER_DEGREE * width_scale
+        if height >= radius_km and width >= radius_km:
+            break
+    else:
+        return None
+
+    center_lng = _cell_index(longitude, -180, 180, lng_bits)
+    center_lat = _cell_index(latitude, -90, 90, lat_bits)
+    cells = set()
+    for lat_index in range(center_lat - 1, center_lat + 2):
+        if 0 <= lat_index < 1 << lat_bits:
+            for lng_index in range(center_lng - 1, center_lng + 2):
+                # Longitude wraps around the antimeridian.
+                cells.add(_interleave(lng_index % (1 << lng_bits),
+                                      lat_index, bits))
+
+    shift = GEOHASH_BITS - bits
+    ranges = []
+    for cell in sorted(cells):
+        low, high = cell << shift, cell + 1 << shift
+        if ranges and ranges[-1][1] == low:
+            ranges[-1] = (ranges[-1][0], high)
+        else:
+            ranges.append((low, high))
+    return ranges
+
+
+def nearby(session, latitude, longitude, radius_km, limit):
+    """The ``limit`` venues nearest the point within ``radius_km``, as
+    ``(distance_km, row)`` pairs, nearest first."""
+    # Where venues are dense a small circle already holds ``limit`` of
+    # them, and nothing outside it can be nearer; widen it only as needed.
+    search_radius = min(radius_km, FIRST_SEARCH_RADIUS_KM)
+    while True:
+        found = _nearest_within(session, latitude, longitude, search_radius,
+                                limit)
+        if len(found) >= limit or search_radius >= radius_km:
+            return found
+        search_radius = min(search_radius * 4, radius_km)
+
+
+def _nearest_within(session, latitude, longitude, radius_km, limit):
+    query = session.query(
+        Venue.id,
+        Venue.name,
+        Venue.address,
+        Venue.city,
+        Venue.state,
+        Venue.latitude,
+        Venue.longitude
+    ).filter(Venue.geohash.isnot(None))
+    ranges = cell_ranges(latitude, longitude, radius_km)
+    if ranges is not None:
+        query = query.filter(or_(*(
+            and_(Venue.geohash >= low, Venue.geohash < high)
+            for low, high in ranges)))
+
+    candidates = ((distance_km(latitude, longitude,
+                               venue.latitude, venue.longitude), venue)
+                  for venue in query)
+    return heapq.nsmallest(
+        limit,
+        (candidate for candidate in candidates if candidate[0] <= radius_km),
+        key=lambda candidate: (candidate[0], candidate[1].id))
+
+
+def _place_key(address, city, state):
+    return tuple(' '.join((part or '').lower().split())
+                 for part in (address, city, state))
+
+
+def load_gazetteer(path):
+    """Read places from a CSV file with ``city``, ``state``, ``latitude``
+    and ``longitude`` columns, and optionally ``address`` for places more
+    precise than a city."""
+    places = {}
+    with open(path, newline='', encoding='utf-8') as places_file:
+        for line, row in enumerate(csv.DictReader(places_file), start=2):
+            try:
+                point = float(row['latitude']), float(row['longitude'])
+            except (KeyError, TypeError, ValueError):
+                point = None
+            if point is None or not (-90 <= point[0] <= 90 and
+                                     -180 <= point[1] <= 180):
+                raise ValueError(f'{path}, line {line}: expected a latitude '
+                                 'and a longitude in degrees')
+            places[_place_key(row.get('address'), row.get('city'),
+                              row.get('state'))] = point
+    return places
+
+
+def locate(places, address, city, state):
+    return places.get(_place_key(address, city, state)) or \
+        places.get(_place_key(None, city, state))
+
+
+def set_locations(session, locations):
+    """Store ``(venue_id, latitude, longitude)`` triples and their
+    geohashes, without committing."""
+    table = Venue.__table__
+    session.execute(
+        update(table).where(table.c.id == bindparam('venue_id')).values(
+            latitude=bindparam('venue_latitude'),
+            longitude=bindparam('venue_longitude'),
+            geohash=bindparam('venue_geohash')),
+        [{'venue_id': venue_id,
+          'venue_latitude': latitude,
+          'venue_longitude': longitude,
+          'venue_geohash': encode(latitude, longitude)}
+         for venue_id, latitude, longitude in locations])
+
+
+def geocode(session, places, everything=False, batch_size=5000):
+    """Locate venues without coordinates, or all of them with
+    ``everything``; returns how many were located and how many were not
+    found in ``places``."""
+    query = session.query(Venue.id, Venue.address, Venue.city, Venue.state)
+    if not everything:
+        query = query.filter(Venue.latitude.is_(None))
+    located = unmatched = 0
+    batch = []
+    for venue_id, address, city, state in query.order_by(Venue.id).all():
+        point = locate(places, address, city, state)
+        if point is None:
+            unmatched += 1
+            continue
+        batch.append((venue_id,) + point)
+        if len(batch) >= batch_size:
+            set_locations(session, batch)
+            session.commit()
+            located += len(batch)
+            batch = []
+    if batch:
+        set_locations(session, batch)
+        session.commit()
+        located += len(batch)
+    return located, unmatched
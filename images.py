@@ -0,0 +1,366 @@
+"""Image proxy serving resized copies of venue and artist ``image_link``s.
+
+Pages link to ``thumbnail_url(image_link)``: a signed URL served by this
+app, so the proxy only fetches URLs it handed out itself. Each source is
+fetched once through a pluggable fetcher and resized on a worker pool; the
+network fetcher only connects to public addresses and only accepts images.
+Sources and thumbnails are stored in a disk cache named by content hash,
+which is kept under ``IMAGE_CACHE_MAX_BYTES`` by evicting the least recently
+used files.
+"""
+import hashlib
+import http.client
+import io
+import ipaddress
+import os
+import socket
+import tempfile
+import threading
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from flask import abort, current_app, redirect, send_file, url_for
+from itsdangerous import BadSignature, URLSafeSerializer
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # without Pillow sources are served unresized
+    Image = None
+
+SIZES = {
+    'tile': (300, 300),
+    'detail': (600, 600),
+}
+
+
+class FetchError(Exception):
+    pass
+
+
+def _connect_public(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT,
+                    source_address=None):
+    # Used in place of socket.create_connection, so the address checked is
+    # the one connected to, for the first request and for every redirect.
+    host, port = address
+    addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    for family, kind, protocol, name, sockaddr in addresses:
+        ip = ipaddress.ip_address(sockaddr[0].split('%', 1)[0])
+        if not ip.is_global or ip.is_multicast:
+            raise FetchError(f'{host!r} resolves to non-public address {ip}')
+    error = None
+    for family, kind, protocol, name, sockaddr in addresses:
+        try:
+            return socket.create_connection(sockaddr[:2], timeout,
+                                            source_address)
+        except OSError as connect_error:
+            error = connect_error
+    raise error or OSError(f'Could not resolve {host!r}')
+
+
+class _PublicHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect_public
+
+
+class _PublicHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = _connect_public
+
+
+class _PublicHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, request):
+        return self.do_open(_PublicHTTPConnection, request)
+
+
+class _PublicHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, request):
+        return self.do_open(_PublicHTTPSConnection, request,
+                            context=self._context)
+
+
+class _HTTPRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, request, fp, code, message, headers, url):
+        if urllib.parse.urlsplit(url).scheme not in ('http', 'https'):
+            raise FetchError(f'Refusing redirect to {url!r}')
+        return super().redirect_request(request, fp, code, message, headers,
+                                        url)
+
+
+class UrlFetcher:
+    """Fetches images over HTTP(S) from hosts with public addresses only,
+    so signed links cannot reach the app's own network."""
+
+    def __init__(self, timeout=5, max_bytes=10 * 1024 * 1024):
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        # No proxies: the proxy's address is not the one to check.
+        self.opener = urllib.request.build_opener(
+            urllib.request.ProxyHandler({}), _PublicHTTPHandler,
+            _PublicHTTPSHandler, _HTTPRedirectHandler)
+
+    def __call__(self, url):
+        if not url.startswith(('http://', 'https://')):
+            raise FetchError(f'Unsupported image URL {url!r}')
+        request = urllib.request.Request(
+            url, headers={'User-Agent': 'fyyur-image-proxy'})
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                content_type = response.headers.get_content_type()
+                if not content_type.startswith('image/'):
+                    raise FetchError(f'{url!r} is {content_type}, '
+                                     'not an image')
+                content = response.read(self.max_bytes + 1)
+        except (OSError, ValueError) as error:
+            raise FetchError(f'Could not fetch {url!r}: {error}') from error
+        if len(content) > self.max_bytes:
+            raise FetchError(f'{url!r} is larger than {self.max_bytes} bytes')
+        return content
+
+
+class LocalFetcher:
+    # Stands in for the network in tests and offline runs: serves files
+    # from a directory by the last path segment of the URL.
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.fetched = []
+
+    def __call__(self, url):
+        self.fetched.append(url)
+        name = os.path.basename(url.split('?', 1)[0])
+        path = os.path.join(self.directory, name)
+        if not name or not os.path.isfile(path):
+            raise FetchError(f'No local image for {url!r}')
+        with open(path, 'rb') as source:
+            return source.read()
+
+
+# Leading bytes of the raster formats browsers display, for serving sources
+# as they are when Pillow is not installed. Anything else, SVG included, is
+# sent as an attachment type browsers will not render in the page.
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF8', 'image/gif'),
+    (b'RIFF', 'image/webp'),
+)
+
+
+def image_type(head):
+    for signature, mimetype in SIGNATURES:
+        if head.startswith(signature) and (
+                mimetype != 'image/webp' or head[8:12] == b'WEBP'):
+            return mimetype
+    return 'application/octet-stream'
+
+
+def make_thumbnail(content, size):
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            thumbnail = ImageOps.fit(ImageOps.exif_transpose(image)
+                                     .convert('RGB'), size)
+    except (OSError, ValueError) as error:
+        raise FetchError(f'Unreadable image: {error}') from error
+    output = io.BytesIO()
+    thumbnail.save(output, 'JPEG', quality=82, optimize=True)
+    return output.getvalue()
+
+
+class DiskCache:
+    """Files named by the hash of their content, evicted least recently
+    used first once the total size passes ``max_bytes``."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._files = OrderedDict()
+        self.size = 0
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        # Modification times are touched on every hit, so they carry the
+        # recency order across restarts.
+        found = []
+        for root, directories, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                if filename.endswith('.tmp'):
+                    os.unlink(path)
+                    continue
+                stat = os.stat(path)
+                found.append((stat.st_mtime, path, stat.st_size))
+        for mtime, path, size in sorted(found):
+            self._files[path] = size
+            self.size += size
+
+    def path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    def get(self, path):
+        with self._lock:
+            if path not in self._files:
+                return None
+            self._files.move_to_end(path)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self._forget(path)
+            return None
+        return path
+
+    def put(self, path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(
+            dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(descriptor, 'wb') as output:
+            output.write(content)
+        os.replace(temporary, path)
+        with self._lock:
+            self.size += len(content) - self._files.pop(path, 0)
+            self._files[path] = len(content)
+            evicted = []
+            while self.size > self.max_bytes and len(self._files) > 1:
+                oldest, size = self._files.popitem(last=False)
+                self.size -= size
+                evicted.append(oldest)
+        for oldest in evicted:
+            try:
+                os.unlink(oldest)
+            except FileNotFoundError:
+                pass
+        return path
+
+    def _forget(self, path):
+        with self._lock:
+            self.size -= self._files.pop(path, 0)
+
+
+def _digest(value):
+    return hashlib.sha256(value).hexdigest()
+
+
+class ImageProxy:
+    def __init__(self, app=None, fetcher=None):
+        self.fetcher = fetcher
+        self._pending = {}
+        self._pending_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        if self.fetcher is None:
+            if config['IMAGE_FETCHER'] == 'local':
+                self.fetcher = LocalFetcher(config['IMAGE_LOCAL_DIR'])
+            else:
+                self.fetcher = UrlFetcher(
+                    timeout=config['IMAGE_FETCH_TIMEOUT'],
+                    max_bytes=config['IMAGE_MAX_SOURCE_BYTES'])
+        self.cache = DiskCache(config['IMAGE_CACHE_DIR'],
+                               config['IMAGE_CACHE_MAX_BYTES'])
+        self.executor = ThreadPoolExecutor(
+            max_workers=config['IMAGE_WORKERS'],
+            thread_name_prefix='image-proxy')
+        self.wait_seconds = config['IMAGE_WAIT_SECONDS']
+        self.max_age = config['IMAGE_MAX_AGE']
+        self.signer = URLSafeSerializer(config['SECRET_KEY'],
+                                        salt='image-proxy')
+        app.add_url_rule('/images/<any(tile, detail):size>/<token>',
+                         'image', self.serve)
+        app.add_template_global(self.thumbnail_url)
+        app.extensions['image_proxy'] = self
+
+    def thumbnail_url(self, source, size='tile'):
+        if not source:
+            return ''
+        return url_for('image', size=size, token=self.signer.dumps(source))
+
+    def _source_path(self, source):
+        # The source URL maps to the hash of the content it served, so a
+        # source is fetched once and identical images are stored once.
+        index = self.cache.path('sources', _digest(source.encode()))
+        if self.cache.get(index):
+            with open(index) as entry:
+                path = self.cache.get(self.cache.path('originals',
+                                                      entry.read()))
+            if path:
+                return path
+        content = self.fetcher(source)
+        digest = _digest(content)
+        path = self.cache.put(self.cache.path('originals', digest), content)
+        self.cache.put(index, digest.encode())
+        return path
+
+    def _cached(self, source, size):
+        # What _render would return, if it is cached already.
+        index = self.cache.path('sources', _digest(source.encode()))
+        if not self.cache.get(index):
+            return None
+        try:
+            with open(index) as entry:
+                digest = entry.read()
+        except FileNotFoundError:
+            return None
+        if Image is None:
+            return self.cache.get(self.cache.path('originals', digest))
+        return self.cache.get(self.cache.path('thumbnails', size, digest))
+
+    def _render(self, source, size):
+        original = self._source_path(source)
+        if Image is None:
+            return original
+        with open(original, 'rb') as source_file:
+            content = source_file.read()
+        digest = os.path.basename(original)
+        path = self.cache.path('thumbnails', size, digest)
+        if not self.cache.get(path):
+            self.cache.put(path, make_thumbnail(content, SIZES[size]))
+        return path
+
+    def thumbnail(self, source, size):
+        """Path of the cached thumbnail, rendering it on the worker pool
+        if needed; concurrent requests for one image share the job."""
+        path = self._cached(source, size)
+        if path is not None:
+            return path
+        key = (source, size)
+        with self._pending_lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self.executor.submit(self._render, source, size)
+                self._pending[key] = future
+                future.add_done_callback(
+                    lambda done: self._finish(key, done))
+        return future.result(timeout=self.wait_seconds)
+
+    def _finish(self, key, future):
+        with self._pending_lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    def serve(self, size, token):
+        try:
+            source = self.signer.loads(token)
+        except BadSignature:
+            abort(404)
+        try:
+            path = self.thumbnail(source, size)
+        except FutureTimeout:
+            # Still rendering; show the original this time.
+            return redirect(source)
+        except FetchError:
+            current_app.logger.warning('Image proxy could not load %s',
+                                       source, exc_info=True)
+            abort(404)
+        with open(path, 'rb') as thumbnail:
+            mimetype = image_type(thumbnail.read(16))
+        return send_file(path, mimetype=mimetype,
+                         etag=f'{size}-{os.path.basename(path)}',
+                         conditional=True, max_age=self.max_age)
@@ -0,0 +1,213 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+
+from sqlalchemy import insert
+from werkzeug.datastructures import MultiDict
+
+from forms import VenueForm, ArtistForm, ShowForm
+from models import Venue, Artist, Show
+from scheduling import BatchSchedule
+
+# Columns loaded for each kind of row, in COPY order. Every column is also a
+# field of the matching form, so rows are validated by the same rules as the
+# create pages.
+IMPORT_KINDS = {
+    'venues': (Venue, VenueForm, (
+        'name', 'city', 'state', 'address', 'phone', 'image_link',
+        'facebook_link', 'genres', 'website_link', 'seeking_talent',
+        'seeking_description')),
+    'artists': (Artist, ArtistForm, (
+        'name', 'city', 'state', 'phone', 'image_link', 'facebook_link',
+        'genres', 'website_link', 'seeking_venue', 'seeking_description')),
+    'shows': (Show, ShowForm,
+              ('venue_id', 'artist_id', 'start_time', 'end_time')),
+}
+
+
+class ImportReport:
+    def __init__(self):
+        self.loaded = 0
+        self.rejected = 0
+        self.started = time.monotonic()
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        return (self.loaded + self.rejected) / elapsed if elapsed else 0.0
+
+    def __str__(self):
+        return f'{self.loaded} loaded, {self.rejected} rejected ' \
+            f'({self.rate:.0f} rows/s)'
+
+
+def read_rows(path):
+    # Rows are streamed one at a time so memory does not grow with the file.
+    with open(path, newline='', encoding='utf-8') as source:
+        if path.endswith(('.jsonl', '.ndjson')):
+            for line in source:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            for row in csv.DictReader(source):
+                yield row
+
+
+# Spellings of false in CSV files, including the exporter's ``false``;
+# BooleanField itself only takes ``false`` and the empty string as false.
+FALSE_STRINGS = frozenset(('', 'false', 'f', '0', 'no', 'n', 'off'))
+BOOLEAN_COLUMNS = ('seeking_talent', 'seeking_venue')
+
+
+def _form_data(row):
+    data = MultiDict()
+    for name, value in row.items():
+        if name == 'genres' and isinstance(value, str):
+            value = [genre.strip() for genre in value.split(',')
+                     if genre.strip()]
+        elif name in BOOLEAN_COLUMNS and isinstance(value, str):
+            value = value.strip().lower() not in FALSE_STRINGS
+        if isinstance(value, list):
+            for item in value:
+                data.add(name, str(item))
+        elif isinstance(value, bool) or value is None:
+            data.add(name, value or '')
+        else:
+            data.add(name, str(value))
+    return data
+
+
+def validate_row(form_class, columns, row):
+    form = form_class(_form_data(row), meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+    values = {column: form[column].data for column in columns}
+    if 'venue_id' in values:
+        try:
+            values['venue_id'] = int(values['venue_id'])
+            values['artist_id'] = int(values['artist_id'])
+        except (TypeError, ValueError):
+            return None, {'id': ['venue_id and artist_id must be integers']}
+    return values, None
+
+
+def _known_references(session, batch):
+    # Shows must point at existing rows; one lookup per batch and table.
+    venue_ids = {values['venue_id'] for line, row, values in batch}
+    artist_ids = {values['artist_id'] for line, row, values in batch}
+    known_venues = {venue_id for venue_id, in session.query(Venue.id)
+                    .filter(Venue.id.in_(venue_ids))}
+    known_artists = {artist_id for artist_id, in session.query(Artist.id)
+                     .filter(Artist.id.in_(artist_ids))}
+    return known_venues, known_artists
+
+
+def _slot(values):
+    return (values['venue_id'], values['artist_id'],
+            values['start_time'], values['end_time'])
+
+
+def _copy_value(value):
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, list):
+        return '{' + ','.join(
+            '"' + item.replace('\\', '\\\\').replace('"', '\\"') + '"'
+            for item in value) + '}'
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def copy_batch(session, model, columns, batch):
+    # PostgreSQL COPY is the fastest bulk path; other databases get a
+    # single executemany INSERT per batch.
+    connection = session.connection()
+    if connection.dialect.name != 'postgresql':
+        session.execute(insert(model), batch)
+        return
+    # COPY skips Python-side column defaults, so scalar ones are written
+    # out with the rows.
+    defaults = {column.name: column.default.arg
+                for column in model.__table__.columns
+                if column.name not in columns and column.default is not None
+                and column.default.is_scalar}
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for values in batch:
+        writer.writerow([_copy_value(values[column]) for column in columns] +
+                        [_copy_value(value) for value in defaults.values()])
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+                model.__tablename__,
+                ', '.join(list(columns) + list(defaults))),
+            buffer)
+    finally:
+        cursor.close()
+
+
+def _reject(report, rejects, line, row, errors):
+    report.rejected += 1
+    if rejects is not None:
+        rejects.write(json.dumps({'line': line, 'row': row, 'errors': errors},
+                                 default=str) + '\n')
+
+
+def import_rows(session, kind, rows, batch_size=1000, rejects=None,
+                progress=None):
+    model, form_class, columns = IMPORT_KINDS[kind]
+    report = ImportReport()
+    numbered_rows = enumerate(rows, start=1)
+
+    while True:
+        chunk = list(islice(numbered_rows, batch_size))
+        if not chunk:
+            break
+
+        batch = []
+        for line, row in chunk:
+            values, errors = validate_row(form_class, columns, row)
+            if errors:
+                _reject(report, rejects, line, row, errors)
+            else:
+                batch.append((line, row, values))
+
+        if kind == 'shows' and batch:
+            known_venues, known_artists = _known_references(session, batch)
+            # Existing shows for the whole batch come in one query; rows are
+            # then checked against them and earlier rows in memory.
+            schedule = BatchSchedule()
+            schedule.load(session, [_slot(values)
+                                    for line, row, values in batch])
+            valid = []
+            for line, row, values in batch:
+                errors = {}
+                if values['venue_id'] not in known_venues:
+                    errors['venue_id'] = ['Unknown venue.']
+                if values['artist_id'] not in known_artists:
+                    errors['artist_id'] = ['Unknown artist.']
+                if not errors and schedule.conflicts(*_slot(values)):
+                    errors['start_time'] = [
+                        'Venue or artist is already booked.']
+                if errors:
+                    _reject(report, rejects, line, row, errors)
+                else:
+                    schedule.add(*_slot(values))
+                    valid.append((line, row, values))
+            batch = valid
+
+        if batch:
+            copy_batch(session, model, columns,
+                       [values for line, row, values in batch])
+            session.commit()
+            report.loaded += len(batch)
+
+        if progress is not None:
+            progress(report)
+
+    return report
@@ -0,0 +1,170 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    TimedRotatingFileHandler
+)
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+# Request fields copied onto every record logged while handling a request.
+REQUEST_FIELDS = ('request_id', 'route', 'method', 'path', 'elapsed_ms')
+
+
+class SizedTimedRotatingFileHandler(TimedRotatingFileHandler):
+    """Rotates on a schedule, and earlier whenever the file grows past
+    ``max_bytes``."""
+
+    def __init__(self, filename, max_bytes=0, **kwargs):
+        super().__init__(filename, delay=True, **kwargs)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record):
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes and self.stream is not None:
+            self.stream.seek(0, 2)
+            return self.stream.tell() >= self.max_bytes
+        return False
+
+    def doRollover(self):
+        if int(time.time()) >= self.rolloverAt:
+            super().doRollover()
+        else:
+            self._roll_by_size()
+
+    def _roll_by_size(self):
+        # The scheduled rollover names the file after its interval and
+        # replaces any file of that name, so rollovers within an interval
+        # number theirs instead: error.log.2024-01-01.1, .2, ...
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        started = self.rolloverAt - self.interval
+        interval_name = time.strftime(
+            self.suffix,
+            time.gmtime(started) if self.utc else time.localtime(started))
+        numbers = [number for stamp, number in self._backups().values()
+                   if stamp == interval_name and number != float('inf')]
+        self.rotate(self.baseFilename, f'{self.baseFilename}.{interval_name}.'
+                                       f'{max(numbers, default=0) + 1}')
+        if self.backupCount > 0:
+            for old_file in self.getFilesToDelete():
+                os.remove(old_file)
+
+    def _backups(self):
+        # Backup paths mapped to (interval, number); the scheduled backup
+        # of an interval follows its numbered ones.
+        directory, base = os.path.split(self.baseFilename)
+        backups = {}
+        for name in os.listdir(directory):
+            suffix = name[len(base) + 1:]
+            if name.startswith(base + '.') and self.extMatch.match(suffix):
+                stamp, _, number = suffix.partition('.')
+                backups[os.path.join(directory, name)] = (
+                    stamp, int(number) if number.isdigit() else float('inf'))
+        return backups
+
+    def getFilesToDelete(self):
+        backups = self._backups()
+        oldest_first = sorted(backups, key=backups.get)
+        return oldest_first[:max(len(oldest_first) - self.backupCount, 0)]
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(
+                record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in REQUEST_FIELDS + ('status', 'duration_ms'):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if getattr(record, 'exception', None):
+            entry['exception'] = record.exception
+        elif record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RequestQueueHandler(QueueHandler):
+    # Runs on the request thread: only captures request fields and the
+    # formatted traceback, then hands the record to the listener thread.
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exception = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+            record.exc_text = None
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.route = request.endpoint
+            record.method = request.method
+            record.path = request.path
+            if 'log_started' in g:
+                record.elapsed_ms = round(
+                    (time.perf_counter() - g.log_started) * 1000, 2)
+        return record
+
+
+def _start_request():
+    g.log_started = time.perf_counter()
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+
+
+def _finish_request(response):
+    response.headers['X-Request-ID'] = g.get('request_id', '')
+    logging.getLogger('fyyur.access').info(
+        '%s %s %s', request.method, request.path, response.status_code,
+        extra={'status': response.status_code,
+               'duration_ms': round(
+                   (time.perf_counter() - g.log_started) * 1000, 2)})
+    return response
+
+
+def init_logging(app):
+    """Send app and access logs through a queue to a background thread that
+    writes JSON lines to a rotating file, so request threads never block on
+    log I/O."""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    if app.debug:
+        return
+
+    file_handler = SizedTimedRotatingFileHandler(
+        app.config['LOG_FILE'],
+        max_bytes=app.config['LOG_MAX_BYTES'],
+        when=app.config['LOG_ROTATE_WHEN'],
+        backupCount=app.config['LOG_BACKUP_COUNT'])
+    file_handler.setFormatter(JsonFormatter())
+
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, file_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    queue_handler = RequestQueueHandler(records)
+    level = app.config['LOG_LEVEL']
+    # Flask's default handler writes to stderr on the request thread.
+    app.logger.removeHandler(default_handler)
+    for logger in (app.logger, logging.getLogger('fyyur.access')):
+        logger.setLevel(level)
+        logger.addHandler(queue_handler)
+    app.extensions['log_listener'] = listener
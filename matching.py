@@ -0,0 +1,262 @@
+"""Artist and venue matchmaking.
+
+Ranks the artists seeking a venue for a venue, and the venues seeking
+talent for an artist. A match scores the share of genres the two have in
+common (shared genres over all genres of either), plus a boost when they
+are in the same city or, failing that, the same state.
+
+Candidates come from an in-memory index per model. It groups the seeking
+rows by their genre bitmask (the ``models.GENRE_BITS`` encoding) and then
+by area. Every row in a group has the same score, so a query scores each
+distinct bitmask once and stops once no remaining group can beat the
+matches it already has. The index is kept up to date by the writes of
+this process and rebuilt every ``MATCH_INDEX_TTL`` seconds to pick up
+those of other processes.
+"""
+import heapq
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from models import GENRE_BITS, Venue, Artist
+
+# Column that offers a row as a match, and the model a row is matched to.
+SEEKING = {Venue: 'seeking_talent', Artist: 'seeking_venue'}
+COUNTERPART = {Venue: Artist, Artist: Venue}
+
+Profile = namedtuple('Profile', 'genres city state seeking')
+
+
+def genre_bits(genres):
+    # Names not in enums.Genre carry no bit rather than failing the index.
+    return sum(GENRE_BITS.get(genre, 0) for genre in set(genres or ()))
+
+
+def _area(value):
+    return ' '.join((value or '').lower().split())
+
+
+def profile_fields(model, values):
+    """Profile fields set by ``values``, a mapping of column names to
+    values such as a form's data."""
+    converters = {'genres': ('genres', genre_bits),
+                  'city': ('city', _area),
+                  'state': ('state', _area),
+                  SEEKING[model]: ('seeking', bool)}
+    return {field: convert(values[column])
+            for column, (field, convert) in converters.items()
+            if column in values}
+
+
+def make_profile(model, values):
+    return Profile(**profile_fields(model, values))
+
+
+class MatchIndex:
+    """Profiles of one model's rows, with the seeking ones grouped by
+    genre bitmask and area."""
+
+    def __init__(self, expires=float('inf')):
+        self.expires = expires
+        self._lock = threading.Lock()
+        self._profiles = {}
+        self._groups = defaultdict(lambda: defaultdict(set))
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def set(self, entity_id, profile):
+        with self._lock:
+            self._set(entity_id, profile)
+
+    def update(self, entity_id, fields):
+        # Rows this index has not seen are left to the next rebuild.
+        with self._lock:
+            profile = self._profiles.get(entity_id)
+            if profile is not None:
+                self._set(entity_id, profile._replace(**fields))
+
+    def discard(self, entity_id):
+        with self._lock:
+            self._discard(entity_id)
+
+    def _set(self, entity_id, profile):
+        self._discard(entity_id)
+        self._profiles[entity_id] = profile
+        if profile.seeking and profile.genres:
+            self._groups[profile.genres][profile.state, profile.city] \
+                .add(entity_id)
+
+    def _discard(self, entity_id):
+        profile = self._profiles.pop(entity_id, None)
+        if profile is None or not profile.seeking or not profile.genres:
+            return
+        areas = self._groups[profile.genres]
+        ids = areas[profile.state, profile.city]
+        ids.discard(entity_id)
+        if not ids:
+            del areas[profile.state, profile.city]
+            if not areas:
+                del self._groups[profile.genres]
+
+    def top(self, profile, limit, city_boost, state_boost):
+        """The ``limit`` best matches for ``profile`` as ``(id, score)``
+        pairs, best first; ties go to the lower id."""
+        best = []
+        with self._lock:
+            scored = sorted(
+                (((profile.genres & genres).bit_count() /
+                  (profile.genres | genres).bit_count()), genres)
+                for genres in self._groups if genres & profile.genres)
+            for genre_score, genres in reversed(scored):
+                if len(best) >= limit and \
+                        genre_score + max(city_boost, state_boost, 0) \
+                        < best[0][0]:
+                    break
+                for (state, city), ids in self._groups[genres].items():
+                    score = genre_score
+                    if state and state == profile.state:
+                        score += city_boost if city and \
+                            city == profile.city else state_boost
+                    if len(best) >= limit and score < best[0][0]:
+                        continue
+                    for entity_id in ids:
+                        candidate = (score, -entity_id)
+                        if len(best) < limit:
+                            heapq.heappush(best, candidate)
+                        elif candidate > best[0]:
+                            heapq.heapreplace(best, candidate)
+        return [(-negative_id, score)
+                for score, negative_id in sorted(best, reverse=True)]
+
+
+class Matcher:
+    def __init__(self, db, app=None, generation=None):
+        self.db = db
+        # As in search.SearchEngine: a change of this token expires the
+        # indexes before their TTL.
+        self.generation = generation
+        self._generation = None
+        self._indexes = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.city_boost = app.config['MATCH_CITY_BOOST']
+        self.state_boost = app.config['MATCH_STATE_BOOST']
+        self.ttl = app.config['MATCH_INDEX_TTL']
+        self.listen()
+
+    def matches(self, session, model, entity_id, limit):
+        """Rows of the counterpart model best matching the given venue or
+        artist, as ``(row, score)`` pairs; None when it does not exist."""
+        target = session.query(model.genres, model.city, model.state,
+                               getattr(model, SEEKING[model])) \
+            .filter(model.id == entity_id).one_or_none()
+        if target is None:
+            return None
+        other = COUNTERPART[model]
+        hits = self.index_for(other, session).top(
+            make_profile(model, target._asdict()), limit,
+            self.city_boost, self.state_boost)
+        if not hits:
+            return []
+        # Rows another process changed since the last rebuild may no
+        # longer be on offer.
+        by_id = {row.id: row for row in session.query(
+            other.id,
+            other.name,
+            other.city,
+            other.state,
+            other.genres,
+            other.image_link
+        ).filter(other.id.in_([entity_id for entity_id, score in hits]),
+                 getattr(other, SEEKING[other]).is_(True))}
+        return [(by_id[entity_id], score) for entity_id, score in hits
+                if entity_id in by_id]
+
+    def index_for(self, model, session=None):
+        if self.generation is not None:
+            generation = self.generation()
+            if generation != self._generation:
+                for index in list(self._indexes.values()):
+                    index.expires = 0
+                self._generation = generation
+        index = self._indexes.get(model)
+        if index is not None and time.monotonic() < index.expires:
+            return index
+        # One thread rebuilds an expired index while the others keep
+        # using it; only the first build is waited for.
+        if not self._lock.acquire(blocking=index is None):
+            return index
+        try:
+            index = self._indexes.get(model)
+            if index is None or time.monotonic() >= index.expires:
+                index = self._build(model, session or self.db.session)
+                self._indexes[model] = index
+            return index
+        finally:
+            self._lock.release()
+
+    def _build(self, model, session):
+        index = MatchIndex(expires=time.monotonic() + self.ttl)
+        rows = session.query(model.id, model.genres, model.city,
+                             model.state, getattr(model, SEEKING[model])) \
+            .execution_options(yield_per=1000)
+        for row in rows:
+            values = row._asdict()
+            index.set(values.pop('id'), make_profile(model, values))
+        return index
+
+    def update(self, model, entity_id, values):
+        index = self._indexes.get(model)
+        fields = profile_fields(model, values)
+        if index is not None and fields:
+            index.update(entity_id, fields)
+
+    def discard(self, model, entity_id):
+        index = self._indexes.get(model)
+        if index is not None:
+            index.discard(entity_id)
+
+    def listen(self):
+        # As in search.SearchEngine: changes are collected at flush time
+        # and applied once the transaction commits.
+        event.listen(Session, 'after_flush', self._collect_changes)
+        event.listen(Session, 'after_commit', self._apply_changes)
+        event.listen(Session, 'after_rollback', self._drop_changes)
+
+    def _collect_changes(self, session, flush_context):
+        if not self._indexes:
+            return
+        changes = session.info.setdefault('match_changes', [])
+        for entity in list(session.new) + list(session.dirty):
+            model = type(entity)
+            if model in SEEKING:
+                changes.append((model, entity.id, make_profile(model, {
+                    'genres': entity.genres,
+                    'city': entity.city,
+                    'state': entity.state,
+                    SEEKING[model]: getattr(entity, SEEKING[model]),
+                })))
+        for entity in session.deleted:
+            if type(entity) in SEEKING:
+                changes.append((type(entity), entity.id, None))
+
+    def _apply_changes(self, session):
+        for model, entity_id, profile in session.info.pop('match_changes',
+                                                          ()):
+            index = self._indexes.get(model)
+            if index is None:
+                continue
+            if profile is None:
+                index.discard(entity_id)
+            else:
+                index.set(entity_id, profile)
+
+    def _drop_changes(self, session):
+        session.info.pop('match_changes', None)
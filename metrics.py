@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+# Statements kept per request for the slow request log.
+MAX_LOGGED_STATEMENTS = 50
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def samples(self, name, labels):
+        for bound, count in zip(self.buckets, self.counts):
+            yield f'{name}_bucket', dict(labels, le=str(bound)), count
+        yield f'{name}_bucket', dict(labels, le='+Inf'), self.count
+        yield f'{name}_sum', labels, self.sum
+        yield f'{name}_count', labels, self.count
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(
+        key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in sorted(labels.items()))
+    return '{' + pairs + '}'
+
+
+class RequestMetrics:
+    """Per-route latency, SQL statement counts and database time, served
+    in the Prometheus text format."""
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self.latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+        self.db_seconds = defaultdict(float)
+        self._collectors = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.slow_request_seconds = app.config['SLOW_REQUEST_SECONDS']
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.render)
+        event.listen(Engine, 'before_cursor_execute', self._before_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_execute)
+
+    def collect(self, name, help, collect, kind='gauge'):
+        # Values owned by other components (cache, connection pool) are read
+        # at scrape time; ``collect`` returns a number.
+        self._collectors.append((name, kind, help, collect))
+
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+        g.sql_count = 0
+        g.sql_seconds = 0.0
+        g.sql_statements = []
+
+    def _before_execute(self, conn, cursor, statement, parameters, context,
+                        executemany):
+        conn.info.setdefault('metrics_started', []) \
+            .append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_started'].pop()
+        if has_request_context() and 'sql_statements' in g:
+            g.sql_count += 1
+            g.sql_seconds += elapsed
+            if len(g.sql_statements) < MAX_LOGGED_STATEMENTS:
+                g.sql_statements.append((elapsed, statement))
+
+    def _finish_request(self, response):
+        if 'metrics_started' not in g:
+            return response
+        request_g = g._get_current_object()
+        details = (request.endpoint or 'none', request.method, request.path)
+        if response.is_streamed:
+            # A streamed body (the exports) runs its statements after this
+            # hook, while it is sent; record the request once it is closed.
+            response.call_on_close(
+                lambda: self._record(request_g, response.status_code,
+                                     *details))
+        else:
+            self._record(request_g, response.status_code, *details)
+        return response
+
+    def _record(self, request_g, status, endpoint, method, path):
+        elapsed = time.perf_counter() - request_g.metrics_started
+        labels = (endpoint, method, status)
+        with self._lock:
+            self.latency[labels].observe(elapsed)
+            self.queries[endpoint].observe(request_g.sql_count)
+            self.db_seconds[endpoint] += request_g.sql_seconds
+
+        if elapsed >= self.slow_request_seconds:
+            statements = '\n'.join(
+                f'  {seconds * 1000:.1f}ms {statement}'
+                for seconds, statement in request_g.sql_statements)
+            self.app.logger.warning(
+                'Slow request %s %s: %.1fms, %d statements, %.1fms in '
+                'database\n%s', method, path, elapsed * 1000,
+                request_g.sql_count, request_g.sql_seconds * 1000,
+                statements)
+
+    def _samples(self):
+        with self._lock:
+            yield ('fyyur_request_duration_seconds', 'histogram',
+                   'Request latency by route.',
+                   [sample for (endpoint, method, status), histogram
+                    in self.latency.items()
+                    for sample in histogram.samples(
+                        'fyyur_request_duration_seconds',
+                        {'endpoint': endpoint, 'method': method,
+                         'status': status})])
+            yield ('fyyur_request_sql_statements', 'histogram',
+                   'SQL statements issued per request by route.',
+                   [sample for endpoint, histogram in self.queries.items()
+                    for sample in histogram.samples(
+                        'fyyur_request_sql_statements',
+                        {'endpoint': endpoint})])
+            yield ('fyyur_request_db_seconds_total', 'counter',
+                   'Time spent executing SQL by route.',
+                   [('fyyur_request_db_seconds_total',
+                     {'endpoint': endpoint}, seconds)
+                    for endpoint, seconds in self.db_seconds.items()])
+        for name, kind, help, collect in self._collectors:
+            yield name, kind, help, [(name, {}, collect())]
+
+    def render(self):
+        lines = []
+        for name, kind, help, samples in self._samples():
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for sample, labels, value in samples:
+                lines.append(f'{sample}{_format_labels(labels)} {value}')
+        return Response('\n'.join(lines) + '\n',
+                        mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,30 @@
+"""listing key columns not null
+
+Revision ID: 06582a6921ea
+Revises: c3809a44d933
+Create Date: 2026-10-18 19:35:29.840559
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '06582a6921ea'
+down_revision = 'c3809a44d933'
+branch_labels = None
+depends_on = None
+
+# Columns the venue and artist listings page by. A NULL in a keyset makes
+# the row comparison NULL, which would end the listing at that row.
+KEY_COLUMNS = (('venues', 'city'), ('venues', 'state'), ('artists', 'name'))
+
+
+def upgrade():
+    for table, column in KEY_COLUMNS:
+        op.execute(f"UPDATE {table} SET {column} = '' "
+                   f'WHERE {column} IS NULL')
+        op.alter_column(table, column, nullable=False)
+
+
+def downgrade():
+    for table, column in reversed(KEY_COLUMNS):
+        op.alter_column(table, column, nullable=True)
@@ -0,0 +1,34 @@
+"""show time indexes
+
+Revision ID: 56240a58af14
+Revises: d86792425c2d
+Create Date: 2026-10-18 18:25:32.751526
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '56240a58af14'
+down_revision = 'd86792425c2d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CONCURRENTLY cannot run inside a transaction, and building the indexes
+    # this way keeps the shows table writable while they are created.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_shows_venue_id_start_time', 'shows',
+                        ['venue_id', 'start_time'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_shows_artist_id_start_time', 'shows',
+                        ['artist_id', 'start_time'],
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_shows_artist_id_start_time', table_name='shows',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_shows_venue_id_start_time', table_name='shows',
+                      postgresql_concurrently=True)
@@ -0,0 +1,39 @@
+"""show end time and overlap constraints
+
+Revision ID: 80be1e12ac04
+Revises: 56240a58af14
+Create Date: 2026-10-18 18:36:32.064260
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '80be1e12ac04'
+down_revision = '56240a58af14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('shows', sa.Column('end_time', sa.DateTime(), nullable=True))
+    # Existing shows get the default two hour length.
+    op.execute("UPDATE shows SET end_time = start_time + interval '2 hours'")
+    op.alter_column('shows', 'end_time', nullable=False)
+
+    # Fails if the existing schedule already double-books a venue or an
+    # artist; those shows have to be moved or removed first.
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for column in ('venue_id', 'artist_id'):
+        name = column.split('_')[0]
+        op.execute(
+            f'ALTER TABLE shows ADD CONSTRAINT ex_shows_{name}_overlap '
+            f'EXCLUDE USING gist ({column} WITH =, '
+            f'tsrange(start_time, end_time) WITH &&)')
+
+
+def downgrade():
+    op.drop_constraint('ex_shows_artist_overlap', 'shows')
+    op.drop_constraint('ex_shows_venue_overlap', 'shows')
+    op.drop_column('shows', 'end_time')
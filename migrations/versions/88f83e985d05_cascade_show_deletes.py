@@ -0,0 +1,35 @@
+"""cascade show deletes
+
+Revision ID: 88f83e985d05
+Revises: ba1a5380af33
+Create Date: 2026-10-18 18:45:08.307916
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '88f83e985d05'
+down_revision = 'ba1a5380af33'
+branch_labels = None
+depends_on = None
+
+
+# Names PostgreSQL gave the unnamed constraints of the initial schema.
+FOREIGN_KEYS = (
+    ('shows_venue_id_fkey', 'venues', 'venue_id'),
+    ('shows_artist_id_fkey', 'artists', 'artist_id'),
+)
+
+
+def upgrade():
+    for name, table, column in FOREIGN_KEYS:
+        op.drop_constraint(name, 'shows', type_='foreignkey')
+        op.create_foreign_key(name, 'shows', table, [column], ['id'],
+                              ondelete='CASCADE')
+
+
+def downgrade():
+    for name, table, column in FOREIGN_KEYS:
+        op.drop_constraint(name, 'shows', type_='foreignkey')
+        op.create_foreign_key(name, 'shows', table, [column], ['id'])
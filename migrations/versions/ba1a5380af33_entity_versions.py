@@ -0,0 +1,29 @@
+"""entity versions
+
+Revision ID: ba1a5380af33
+Revises: e53ba692a8ff
+Create Date: 2026-10-18 18:39:35.642591
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ba1a5380af33'
+down_revision = 'e53ba692a8ff'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venues', 'artists'):
+        op.add_column(table, sa.Column('version', sa.Integer(),
+                                       nullable=False, server_default='1'))
+        # The default only fills existing rows; the ORM sets new versions.
+        op.alter_column(table, 'version', server_default=None)
+
+
+def downgrade():
+    for table in ('artists', 'venues'):
+        op.drop_column(table, 'version')
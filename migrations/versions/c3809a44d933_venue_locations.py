@@ -0,0 +1,31 @@
+"""venue locations
+
+Revision ID: c3809a44d933
+Revises: 88f83e985d05
+Create Date: 2026-10-18 18:56:30.977589
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3809a44d933'
+down_revision = '88f83e985d05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('venues', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('venues', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('venues', sa.Column('geohash', sa.BigInteger(),
+                                      nullable=True))
+    op.create_index('ix_venues_geohash', 'venues', ['geohash'])
+
+
+def downgrade():
+    op.drop_index('ix_venues_geohash', table_name='venues')
+    op.drop_column('venues', 'geohash')
+    op.drop_column('venues', 'longitude')
+    op.drop_column('venues', 'latitude')
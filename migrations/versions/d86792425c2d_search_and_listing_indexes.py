@@ -0,0 +1,61 @@
+"""search and listing indexes
+
+Revision ID: d86792425c2d
+Revises: d010cfbc1727
+Create Date: 2026-10-18 19:23:42.354385
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'd86792425c2d'
+down_revision = 'd010cfbc1727'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # As in 56240a58af14: built CONCURRENTLY, outside a transaction, so the
+    # tables stay writable while the indexes are created.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_venues_city_state', 'venues',
+                        ['city', 'state', 'id'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_venues_genres', 'venues', ['genres'],
+                        postgresql_using='gin',
+                        postgresql_concurrently=True)
+        op.create_index('ix_venues_name_trgm', 'venues', ['name'],
+                        postgresql_using='gin',
+                        postgresql_ops={'name': 'gin_trgm_ops'},
+                        postgresql_concurrently=True)
+        op.create_index('ix_artists_genres', 'artists', ['genres'],
+                        postgresql_using='gin',
+                        postgresql_concurrently=True)
+        op.create_index('ix_artists_name', 'artists', ['name', 'id'],
+                        postgresql_concurrently=True)
+        op.create_index('ix_artists_name_trgm', 'artists', ['name'],
+                        postgresql_using='gin',
+                        postgresql_ops={'name': 'gin_trgm_ops'},
+                        postgresql_concurrently=True)
+        op.create_index('ix_shows_start_time', 'shows', ['start_time', 'id'],
+                        postgresql_concurrently=True)
+
+
+def downgrade():
+    # pg_trgm is left installed: other database objects may use it.
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_shows_start_time', table_name='shows',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_artists_name_trgm', table_name='artists',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_artists_name', table_name='artists',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_artists_genres', table_name='artists',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_venues_name_trgm', table_name='venues',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_venues_genres', table_name='venues',
+                      postgresql_concurrently=True)
+        op.drop_index('ix_venues_city_state', table_name='venues',
+                      postgresql_concurrently=True)
@@ -0,0 +1,48 @@
+"""show counters
+
+Revision ID: e53ba692a8ff
+Revises: 80be1e12ac04
+Create Date: 2026-10-18 18:38:13.809124
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e53ba692a8ff'
+down_revision = '80be1e12ac04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('venues', 'artists'):
+        for column in ('upcoming_shows_count', 'past_shows_count'):
+            op.add_column(table, sa.Column(column, sa.Integer(),
+                                           nullable=False, server_default='0'))
+    op.add_column('shows', sa.Column('counted_upcoming', sa.Boolean(),
+                                     nullable=False,
+                                     server_default=sa.false()))
+
+    # Same computation as counters.recount().
+    op.execute('UPDATE shows SET '
+               'counted_upcoming = start_time >= localtimestamp')
+    for table, column in (('venues', 'venue_id'), ('artists', 'artist_id')):
+        op.execute(
+            f'UPDATE {table} SET '
+            f'upcoming_shows_count = (SELECT count(*) FROM shows WHERE '
+            f'shows.{column} = {table}.id AND shows.counted_upcoming), '
+            f'past_shows_count = (SELECT count(*) FROM shows WHERE '
+            f'shows.{column} = {table}.id AND NOT shows.counted_upcoming)')
+
+    op.create_index('ix_shows_counted_upcoming', 'shows', ['start_time'],
+                    postgresql_where=sa.text('counted_upcoming'))
+
+
+def downgrade():
+    op.drop_index('ix_shows_counted_upcoming', table_name='shows')
+    op.drop_column('shows', 'counted_upcoming')
+    for table in ('artists', 'venues'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
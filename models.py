@@ -1,26 +1,157 @@
+import sqlite3
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, Boolean, Integer, String, column, event, func, \
+    type_coerce
+from sqlalchemy.dialects.postgresql import ARRAY, ExcludeConstraint
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ColumnElement
+from sqlalchemy.sql.visitors import InternalTraversal
+from sqlalchemy.types import TypeDecorator
+
+from enums import Genre
+from routing import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Bit positions of the genres in the integer encoding used off PostgreSQL.
+# New genres must be appended to enums.Genre so stored masks keep meaning.
+GENRE_BITS = {genre.name: 1 << position
+              for position, genre in enumerate(Genre)}
+
+
+def genre_mask(genres):
+    try:
+        return sum(GENRE_BITS[genre] for genre in set(genres))
+    except KeyError as error:
+        raise ValueError(f'Unknown genre {error.args[0]!r}') from None
+
+
+class GenreList(TypeDecorator):
+    """A list of ``enums.Genre`` names.
+
+    Stored as a text array on PostgreSQL and as an integer bitmask on other
+    databases; ``column.contains([...])`` works on both.
+    """
+    impl = Integer
+    cache_ok = True
+
+    class comparator_factory(TypeDecorator.Comparator):
+        def contains(self, other, **kwargs):
+            return GenresContain(self.expr, other)
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(ARRAY(String(20)))
+        return dialect.type_descriptor(Integer())
+
+    def process_bind_param(self, value, dialect):
+        if value is None or dialect.name == 'postgresql':
+            return value
+        return genre_mask(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None or dialect.name == 'postgresql':
+            return value
+        return [name for name, bit in GENRE_BITS.items() if value & bit]
+
 
-db = SQLAlchemy()
+class GenresContain(ColumnElement):
+    # Rendered per dialect: array containment (@>) on PostgreSQL, a bitmask
+    # test elsewhere.
+    type = Boolean()
+    inherit_cache = True
+    _traverse_internals = [
+        ('column', InternalTraversal.dp_clauseelement),
+        ('genres', InternalTraversal.dp_plain_obj),
+    ]
+
+    def __init__(self, column, genres):
+        self.column = column
+        self.genres = tuple(sorted(set(genres)))
+
+
+@compiles(GenresContain)
+def _compile_genres_contain(element, compiler, **kw):
+    mask = genre_mask(element.genres)
+    column = type_coerce(element.column, Integer())
+    return compiler.process(column.op('&')(mask) == mask, **kw)
+
+
+@compiles(GenresContain, 'postgresql')
+def _compile_genres_contain_postgresql(element, compiler, **kw):
+    column = type_coerce(element.column, ARRAY(String(20)))
+    return compiler.process(column.contains(list(element.genres)), **kw)
+
+
+# Trigram operator classes back the fuzzy name search on PostgreSQL, and
+# btree_gist lets the show exclusion constraints mix = and && in one index.
+for extension in ('pg_trgm', 'btree_gist'):
+    event.listen(
+        db.metadata,
+        'before_create',
+        DDL(f'CREATE EXTENSION IF NOT EXISTS {extension}').execute_if(
+            dialect='postgresql')
+    )
+
+
+@event.listens_for(Engine, 'connect')
+def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite only enforces foreign keys, and so runs the show cascades, when
+    # asked to on each connection.
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
 
 
 class Venue(db.Model):
     __tablename__ = 'venues'
+    __table_args__ = (
+        db.Index('ix_venues_city_state', 'city', 'state', 'id'),
+        db.Index('ix_venues_name_trgm', 'name',
+                 postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'})
+        .ddl_if(dialect='postgresql'),
+        db.Index('ix_venues_genres', 'genres', postgresql_using='gin')
+        .ddl_if(dialect='postgresql'),
+        db.Index('ix_venues_geohash', 'geohash'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
-    city = db.Column(db.String(120))
-    state = db.Column(db.String(120))
+    # The venue listing pages by (city, state, id), so neither may be NULL.
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
     address = db.Column(db.String(120))
+    # Set by geo.geocode; the geohash is derived from the coordinates.
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.BigInteger)
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
 
-    genres = db.Column(db.ARRAY(db.String(20)))
+    genres = db.Column(GenreList)
     website_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, default=False)
     seeking_description = db.Column(db.String(500))
+    # Bumped by every ORM update; keys cached listing tiles. No server
+    # default, so SQLAlchemy can verify the row count of versioned updates
+    # on every dialect.
+    version = db.Column(db.Integer, nullable=False, default=1)
+    # Maintained by counters.py.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                     server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                 server_default='0')
 
-    shows = db.relationship('Show', backref='venue', lazy=True)
+    # Shows are removed by the database's ON DELETE CASCADE.
+    shows = db.relationship('Show', backref='venue', lazy=True,
+                            passive_deletes=True)
+
+    __mapper_args__ = {'version_id_col': version}
 
     def __repr__(self):
         return f'<Venue - id: {self.id}, ' \
@@ -39,22 +170,43 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'artists'
+    __table_args__ = (
+        db.Index('ix_artists_name', 'name', 'id'),
+        db.Index('ix_artists_name_trgm', 'name',
+                 postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'})
+        .ddl_if(dialect='postgresql'),
+        db.Index('ix_artists_genres', 'genres', postgresql_using='gin')
+        .ddl_if(dialect='postgresql'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
+    # The artist listing pages by (name, id).
+    name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
 
-    genres = db.Column(db.ARRAY(db.String(20)))
+    genres = db.Column(GenreList)
     website_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, default=True)
     seeking_description = db.Column(db.String(500))
+    # Bumped by every ORM update; keys cached listing tiles. No server
+    # default, so SQLAlchemy can verify the row count of versioned updates
+    # on every dialect.
+    version = db.Column(db.Integer, nullable=False, default=1)
+    # Maintained by counters.py.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                     server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0,
+                                 server_default='0')
+
+    shows = db.relationship('Show', backref='artist', lazy=True,
+                            passive_deletes=True)
 
-    shows = db.relationship('Show', backref='artist', lazy=True)
+    __mapper_args__ = {'version_id_col': version}
 
     def __repr__(self):
         return f'<Artist - id: {self.id}, ' \
@@ -71,16 +223,44 @@ class Artist(db.Model):
 
 class Show(db.Model):
     __tablename__ = 'shows'
+    __table_args__ = (
+        db.Index('ix_shows_start_time', 'start_time', 'id'),
+        db.Index('ix_shows_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_shows_artist_id_start_time', 'artist_id', 'start_time'),
+        # Only shows still counted as upcoming are visited by a roll.
+        db.Index('ix_shows_counted_upcoming', 'start_time',
+                 postgresql_where=db.text('counted_upcoming'),
+                 sqlite_where=db.text('counted_upcoming')),
+        # A venue or an artist can only be booked once at any moment.
+        ExcludeConstraint(
+            (column('venue_id'), '='),
+            (func.tsrange(column('start_time'), column('end_time')), '&&'),
+            name='ex_shows_venue_overlap', using='gist')
+        .ddl_if(dialect='postgresql'),
+        ExcludeConstraint(
+            (column('artist_id'), '='),
+            (func.tsrange(column('start_time'), column('end_time')), '&&'),
+            name='ex_shows_artist_overlap', using='gist')
+        .ddl_if(dialect='postgresql'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    venue_id = db.Column(db.Integer, db.ForeignKey('venues.id'),
+    venue_id = db.Column(db.Integer,
+                         db.ForeignKey('venues.id', ondelete='CASCADE'),
                          nullable=False)
-    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'),
+    artist_id = db.Column(db.Integer,
+                          db.ForeignKey('artists.id', ondelete='CASCADE'),
                           nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    # Whether the show is in its venue's and artist's upcoming count rather
+    # than the past count; see counters.py.
+    counted_upcoming = db.Column(db.Boolean, nullable=False, default=False,
+                                 server_default=db.false())
 
     def __repr__(self):
         return f'<Show - id: {self.id}, ' \
             f'venue_id: {self.venue_id}, ' \
             f'artist_id: {self.artist_id}, ' \
-            f' start_time: {self.start_time}> '
+            f' start_time: {self.start_time}, ' \
+            f'end_time: {self.end_time}> '
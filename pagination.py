@@ -0,0 +1,95 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Page:
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and 'dt' in value:
+        return datetime.fromisoformat(value['dt'])
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(value) for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+        return [_decode_value(value) for value in values]
+    except (binascii.Error, ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+
+def keyset_paginate(query, order_by, key, after=None, before=None,
+                    per_page=20):
+    """Return one page of ``query`` ordered by the ``order_by`` columns.
+
+    ``order_by`` must end with a unique column (the primary key) so the
+    ordering is total; ``key`` extracts the same values from a result row.
+    Pages are addressed by the key of the last (``after``) or first
+    (``before``) row of the neighbouring page, so every page is a single
+    index range scan no matter how deep it is.
+    """
+    columns = tuple_(*order_by)
+
+    if before is not None:
+        values = decode_cursor(before)
+        if len(values) != len(order_by):
+            raise InvalidCursor(before)
+        query = query.filter(columns < tuple_(*values)) \
+            .order_by(*[column.desc() for column in order_by])
+    else:
+        if after is not None:
+            values = decode_cursor(after)
+            if len(values) != len(order_by):
+                raise InvalidCursor(after)
+            query = query.filter(columns > tuple_(*values))
+        query = query.order_by(*order_by)
+
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    if before is not None:
+        rows.reverse()
+        has_next, has_prev = True, has_more
+    else:
+        has_next, has_prev = has_more, after is not None
+
+    if not rows:
+        return Page(rows)
+
+    return Page(
+        rows,
+        next_cursor=encode_cursor(key(rows[-1])) if has_next else None,
+        prev_cursor=encode_cursor(key(rows[0])) if has_prev else None
+    )
@@ -0,0 +1,67 @@
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record(self, waited, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += timed_out
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a
+    connection, which is what grows once workers outnumber connections."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.stats = self.stats
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started)
+        return connection
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return {}
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    stats = {
+        'size': pool.size(),
+        'max_overflow': pool._max_overflow,
+        'checked_out': pool.checkedout(),
+        'overflow': max(pool.overflow(), 0),
+        'saturation': pool.checkedout() / capacity if capacity else 0.0,
+    }
+    if isinstance(pool, InstrumentedQueuePool):
+        stats.update({
+            'checkouts': pool.stats.checkouts,
+            'timeouts': pool.stats.timeouts,
+            'wait_seconds_total': pool.stats.wait_seconds_total,
+            'wait_seconds_max': pool.stats.wait_seconds_max,
+        })
+    return stats
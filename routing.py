@@ -0,0 +1,168 @@
+"""Read replica routing for ``db.session``.
+
+Reads made while handling GET and HEAD requests go to one of the replicas
+in ``SQLALCHEMY_REPLICA_URIS``, picked in turn once per request. Flushes,
+INSERT/UPDATE/DELETE statements and every other request use the primary. A
+client that has just written reads from the primary for
+``REPLICA_STICKY_SECONDS`` afterwards, so it sees its own changes despite
+replication lag.
+
+Replicas that fail with a connection error, or lag more than
+``REPLICA_MAX_LAG_SECONDS`` behind when probed, are skipped until a later
+probe finds them healthy again; with none healthy, reads fall back to the
+primary.
+"""
+import logging
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+
+READ_METHODS = ('GET', 'HEAD')
+STICKY_COOKIE = 'read_primary'
+BIND_PREFIX = 'replica_'
+
+# Seconds the replica's replay is behind, or 0 when it has replayed all WAL
+# it received; NULL off a standby.
+POSTGRESQL_LAG = text(
+    'SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() '
+    'THEN 0 ELSE EXTRACT(EPOCH FROM now() - '
+    'pg_last_xact_replay_timestamp()) END')
+
+logger = logging.getLogger(__name__)
+
+
+class Replica:
+    def __init__(self, name, engine):
+        self.name = name
+        self.engine = engine
+        self.healthy = True
+        self.next_check = 0.0
+
+
+class ReplicaSet:
+    def __init__(self, replicas, check_interval=10, max_lag=5,
+                 clock=time.monotonic):
+        self.replicas = replicas
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def __len__(self):
+        return len(self.replicas)
+
+    def healthy_count(self):
+        return sum(replica.healthy for replica in self.replicas)
+
+    def choose(self):
+        """Engine of the next healthy replica, or None for the primary."""
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            self._check_if_due(replica)
+            if replica.healthy:
+                return replica.engine
+        return None
+
+    def _check_if_due(self, replica):
+        # Only the thread that finds a probe due runs it; the others keep
+        # using the last result meanwhile.
+        now = self._clock()
+        with self._lock:
+            if now < replica.next_check:
+                return
+            replica.next_check = now + self.check_interval
+        self.check(replica)
+
+    def check(self, replica):
+        try:
+            with replica.engine.connect() as connection:
+                lag = connection.scalar(POSTGRESQL_LAG) \
+                    if connection.dialect.name == 'postgresql' \
+                    else connection.scalar(text('SELECT 0'))
+        except SQLAlchemyError as error:
+            logger.warning('Replica %s is unreachable: %s', replica.name,
+                           error)
+            replica.healthy = False
+            return
+        healthy = lag is None or lag <= self.max_lag
+        if not healthy:
+            logger.warning('Replica %s is %.1fs behind', replica.name, lag)
+        elif not replica.healthy:
+            logger.info('Replica %s is back', replica.name)
+        replica.healthy = healthy
+
+    def mark_down(self, replica):
+        logger.warning('Replica %s failed; reading from the others until '
+                       'it is probed again', replica.name)
+        with self._lock:
+            replica.healthy = False
+            replica.next_check = self._clock() + self.check_interval
+
+
+def read_replica():
+    """Engine this request reads from, or None for the primary."""
+    if not has_request_context() or request.method not in READ_METHODS \
+            or STICKY_COOKIE in request.cookies:
+        return None
+    if 'read_replica' not in g:
+        replicas = current_app.extensions.get('replicas')
+        g.read_replica = replicas.choose() if replicas else None
+    return g.read_replica
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and \
+                not getattr(clause, 'is_dml', False):
+            replica = read_replica()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind,
+                                **kwargs)
+
+
+def configure_replicas(app):
+    # Must run before db.init_app, which creates an engine for every bind.
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for number, url in enumerate(app.config['SQLALCHEMY_REPLICA_URIS']):
+        binds[f'{BIND_PREFIX}{number}'] = url
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def _stick_to_primary(response):
+    if request.method not in READ_METHODS and response.status_code < 400:
+        response.set_cookie(
+            STICKY_COOKIE, '1',
+            max_age=current_app.config['REPLICA_STICKY_SECONDS'],
+            httponly=True, samesite='Lax')
+    return response
+
+
+def init_replicas(app, db):
+    with app.app_context():
+        replicas = [Replica(key, engine)
+                    for key, engine in sorted(db.engines.items(),
+                                              key=lambda item: str(item[0]))
+                    if str(key).startswith(BIND_PREFIX)]
+    replica_set = ReplicaSet(replicas,
+                             check_interval=app.config[
+                                 'REPLICA_CHECK_INTERVAL'],
+                             max_lag=app.config['REPLICA_MAX_LAG_SECONDS'])
+    for replica in replicas:
+        def on_error(context, replica=replica):
+            if context.is_disconnect or \
+                    isinstance(context.sqlalchemy_exception, OperationalError):
+                replica_set.mark_down(replica)
+        event.listen(replica.engine, 'handle_error', on_error)
+    app.extensions['replicas'] = replica_set
+    if replicas:
+        app.after_request(_stick_to_primary)
+    return replica_set
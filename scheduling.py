@@ -0,0 +1,79 @@
+from datetime import timedelta
+
+from sqlalchemy import or_
+
+from models import Show
+
+DEFAULT_SHOW_DURATION = timedelta(hours=2)
+# Upper bound on a show's length. Because no show is longer, a show that
+# overlaps [start, end) must begin after start - MAX_SHOW_DURATION, so the
+# conflict check is a bounded range scan of the (venue_id, start_time) and
+# (artist_id, start_time) indexes rather than a scan of the whole schedule.
+MAX_SHOW_DURATION = timedelta(hours=12)
+# SQLSTATE raised by PostgreSQL when an exclusion constraint rejects a row.
+EXCLUSION_VIOLATION = '23P01'
+
+
+def overlaps(start, end, other_start, other_end):
+    # Intervals are half open, so back-to-back shows do not conflict.
+    return start < other_end and other_start < end
+
+
+def find_conflicts(session, venue_id, artist_id, start, end, exclude_id=None):
+    """Shows that book the venue or the artist during [start, end)."""
+    query = session.query(Show).filter(
+        or_(Show.venue_id == venue_id, Show.artist_id == artist_id),
+        Show.start_time > start - MAX_SHOW_DURATION,
+        Show.start_time < end,
+        Show.end_time > start
+    )
+    if exclude_id is not None:
+        query = query.filter(Show.id != exclude_id)
+    return query.order_by(Show.start_time).all()
+
+
+def conflict_messages(venue_id, artist_id, conflicts):
+    messages = []
+    for show in conflicts:
+        booked = 'Venue' if show.venue_id == venue_id else 'Artist'
+        messages.append(
+            f'{booked} is already booked from {show.start_time:%Y-%m-%d %H:%M}'
+            f' to {show.end_time:%Y-%m-%d %H:%M} (show {show.id}).')
+    return messages
+
+
+class BatchSchedule:
+    """Intervals booked in the database and accepted so far in one import
+    batch, so rows are checked in memory rather than one query each."""
+
+    def __init__(self):
+        self.booked = {}
+
+    def load(self, session, slots):
+        """Add the shows that could overlap any of the ``(venue_id,
+        artist_id, start, end)`` slots, read in one range query."""
+        if not slots:
+            return
+        venue_ids = {slot[0] for slot in slots}
+        artist_ids = {slot[1] for slot in slots}
+        start = min(slot[2] for slot in slots)
+        end = max(slot[3] for slot in slots)
+        rows = session.query(Show.venue_id, Show.artist_id, Show.start_time,
+                             Show.end_time).filter(
+            or_(Show.venue_id.in_(venue_ids),
+                Show.artist_id.in_(artist_ids)),
+            Show.start_time > start - MAX_SHOW_DURATION,
+            Show.start_time < end,
+            Show.end_time > start
+        )
+        for venue_id, artist_id, show_start, show_end in rows:
+            self.add(venue_id, artist_id, show_start, show_end)
+
+    def conflicts(self, venue_id, artist_id, start, end):
+        return any(overlaps(start, end, other_start, other_end)
+                   for key in (('venue', venue_id), ('artist', artist_id))
+                   for other_start, other_end in self.booked.get(key, ()))
+
+    def add(self, venue_id, artist_id, start, end):
+        for key in (('venue', venue_id), ('artist', artist_id)):
+            self.booked.setdefault(key, []).append((start, end))
@@ -0,0 +1,210 @@
+import re
+import threading
+from collections import Counter, defaultdict
+
+from sqlalchemy import event, func, or_, text
+from sqlalchemy.orm import Session
+
+from models import Venue, Artist
+
+SEARCHABLE_MODELS = (Venue, Artist)
+
+_word_re = re.compile(r'\w+')
+
+
+def trigrams(text):
+    # Same tokenisation as pg_trgm: lower-cased alphanumeric words, each
+    # padded with two leading spaces and one trailing space.
+    grams = set()
+    for word in _word_re.findall((text or '').lower()):
+        padded = '  ' + word + ' '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class NgramIndex:
+    """In-memory trigram index over the ``name`` column of one model.
+
+    Used where pg_trgm is not available (SQLite test and profiling
+    databases). Scores mirror pg_trgm's ``word_similarity``: the share of
+    the search term's trigrams that appear in the name.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = defaultdict(set)
+        self._names = {}
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, entity_id, name):
+        with self._lock:
+            self._discard(entity_id)
+            self._names[entity_id] = name or ''
+            for gram in trigrams(name):
+                self._postings[gram].add(entity_id)
+
+    def discard(self, entity_id):
+        with self._lock:
+            self._discard(entity_id)
+
+    def _discard(self, entity_id):
+        name = self._names.pop(entity_id, None)
+        if name is None:
+            return
+        for gram in trigrams(name):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(entity_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def search(self, term, limit, threshold):
+        needle = term.lower()
+        grams = trigrams(term)
+        with self._lock:
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._postings.get(gram, ()))
+            scored = []
+            for entity_id, count in shared.items():
+                name = self._names[entity_id]
+                if needle in name.lower():
+                    score = 1.0
+                else:
+                    score = count / len(grams)
+                if score >= threshold:
+                    scored.append((-score, name, entity_id))
+        scored.sort()
+        return [(entity_id, -score) for score, name, entity_id
+                in scored[:limit]]
+
+
+class SearchEngine:
+    def __init__(self, db, app=None, generation=None):
+        self.db = db
+        # Optional callable returning a token; when it changes, as after a
+        # bulk import by another process, the indexes are rebuilt.
+        self.generation = generation
+        self._generation = None
+        self._indexes = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.limit = app.config['SEARCH_RESULT_LIMIT']
+        self.threshold = app.config['SEARCH_SIMILARITY_THRESHOLD']
+        self.backend = app.config['SEARCH_BACKEND']
+        self.listen()
+
+    def uses_trigram_index(self):
+        if self.backend == 'auto':
+            return self.db.engine.dialect.name == 'postgresql'
+        return self.backend == 'trigram'
+
+    def search(self, model, term, criteria=(), session=None):
+        session = session or self.db.session
+        term = term.strip()
+        if not term:
+            return session.query(model).filter(*criteria) \
+                .order_by(model.name, model.id).limit(self.limit).all()
+        if self.uses_trigram_index():
+            return self._search_trigram(session, model, term, criteria)
+        return self._search_ngram(session, model, term, criteria)
+
+    def _search_trigram(self, session, model, term, criteria):
+        # ILIKE keeps exact substring hits, %> adds typo-tolerant word
+        # matches; both are answered from the gin_trgm_ops index. %> uses
+        # the threshold set here for the rest of the transaction.
+        session.execute(
+            text("SELECT set_config('pg_trgm.word_similarity_threshold', "
+                 ":threshold, true)"),
+            {'threshold': str(self.threshold)})
+        return session.query(model).filter(*criteria).filter(or_(
+            model.name.ilike('%' + term + '%'),
+            model.name.op('%>')(term)
+        )).order_by(
+            func.word_similarity(term, model.name).desc(),
+            model.name,
+            model.id
+        ).limit(self.limit).all()
+
+    def _search_ngram(self, session, model, term, criteria):
+        # Facet criteria are only known to SQL, so with any the hits are
+        # not cut to the limit first but checked in score order, a chunk
+        # at a time, until the limit is filled.
+        hits = self.index_for(model, session).search(
+            term, None if criteria else self.limit, self.threshold)
+        chunk = self.limit * 4
+        results = []
+        for offset in range(0, len(hits), chunk):
+            ids = [entity_id for entity_id, score
+                   in hits[offset:offset + chunk]]
+            by_id = {entity.id: entity for entity in session.query(model)
+                     .filter(model.id.in_(ids), *criteria)}
+            results.extend(by_id[entity_id] for entity_id in ids
+                           if entity_id in by_id)
+            if len(results) >= self.limit:
+                break
+        return results[:self.limit]
+
+    def index_for(self, model, session=None):
+        if self.generation is not None:
+            generation = self.generation()
+            if generation != self._generation:
+                with self._lock:
+                    self._indexes.clear()
+                    self._generation = generation
+        index = self._indexes.get(model)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(model)
+                if index is None:
+                    index = NgramIndex()
+                    rows = (session or self.db.session) \
+                        .query(model.id, model.name) \
+                        .execution_options(yield_per=1000)
+                    for entity_id, name in rows:
+                        index.add(entity_id, name)
+                    self._indexes[model] = index
+        return index
+
+    def update(self, model, entity_id, name):
+        index = self._indexes.get(model)
+        if index is not None:
+            index.add(entity_id, name)
+
+    def discard(self, model, entity_id):
+        index = self._indexes.get(model)
+        if index is not None:
+            index.discard(entity_id)
+
+    def listen(self):
+        # Name changes are collected at flush time and only applied to the
+        # in-memory indexes once the transaction commits.
+        event.listen(Session, 'after_flush', self._collect_changes)
+        event.listen(Session, 'after_commit', self._apply_changes)
+        event.listen(Session, 'after_rollback', self._drop_changes)
+
+    def _collect_changes(self, session, flush_context):
+        if not self._indexes:
+            return
+        changes = session.info.setdefault('search_changes', [])
+        for entity in list(session.new) + list(session.dirty):
+            if isinstance(entity, SEARCHABLE_MODELS):
+                changes.append((type(entity), entity.id, entity.name))
+        for entity in session.deleted:
+            if isinstance(entity, SEARCHABLE_MODELS):
+                changes.append((type(entity), entity.id, None))
+
+    def _apply_changes(self, session):
+        for model, entity_id, name in session.info.pop('search_changes', ()):
+            if name is None:
+                self.discard(model, entity_id)
+            else:
+                self.update(model, entity_id, name)
+
+    def _drop_changes(self, session):
+        session.info.pop('search_changes', None)
@@ -0,0 +1,87 @@
+import hashlib
+import os
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+from cache import Cache, LRUCache
+
+
+class FragmentCacheExtension(Extension):
+    """``{% cache 'tile', venue.id, venue.version %}...{% endcache %}``
+
+    Caches the rendered body under a key built from the arguments, so a
+    fragment is rebuilt only when one of them changes. Keys also carry a
+    digest of the template sources, so a deploy with changed templates
+    never serves fragments rendered by the old ones.
+    """
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None, fragment_cache_ttl=None,
+                           fragment_cache_prefix='fragment')
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_render', [nodes.List(parts)]),
+            [], [], body).set_lineno(lineno)
+
+    def _render(self, parts, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        key = ':'.join([self.environment.fragment_cache_prefix] +
+                       [str(part) for part in parts])
+        return cache.get_or_set(key, caller,
+                                ttl=self.environment.fragment_cache_ttl)
+
+
+def templates_digest(environment):
+    digest = hashlib.sha1()
+    for name in environment.list_templates():
+        source, filename, uptodate = environment.loader.get_source(
+            environment, name)
+        digest.update(name.encode())
+        digest.update(source.encode())
+    return digest.hexdigest()[:12]
+
+
+def init_templates(app):
+    """Persist compiled templates across processes and enable
+    ``{% cache %}`` fragments; returns the fragment cache.
+
+    Fragments get a per-process LRU of their own, so rendering a listing
+    does not evict cached detail pages, their hits are counted apart, and
+    no tile waits on a round trip to the shared cache.
+    """
+    fragments = Cache(local=LRUCache(
+        maxsize=app.config['TEMPLATE_FRAGMENT_CACHE_SIZE'],
+        ttl=app.config['TEMPLATE_FRAGMENT_TTL']))
+    environment = app.jinja_env
+    directory = app.config['TEMPLATE_BYTECODE_DIR']
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        environment.bytecode_cache = FileSystemBytecodeCache(directory)
+    environment.add_extension(FragmentCacheExtension)
+
+    if app.config['TEMPLATE_FRAGMENT_CACHE']:
+        environment.fragment_cache = fragments
+        environment.fragment_cache_ttl = app.config['TEMPLATE_FRAGMENT_TTL']
+        environment.fragment_cache_prefix = \
+            'fragment:' + templates_digest(environment)
+    return fragments
+
+
+def precompile_templates(app):
+    # Loads every template into the environment's cache, compiling it or
+    # reading it from the bytecode cache, so the first requests of a new
+    # worker do not pay for it. Filters must be registered by now.
+    if app.config['TEMPLATE_PRECOMPILE']:
+        for name in app.jinja_env.list_templates():
+            app.jinja_env.get_template(name)
@@ -0,0 +1,4 @@
+import os
+
+# Must be set before app.py is imported: the config profile is read then.
+os.environ.setdefault('FYYUR_ENV', 'testing')
@@ -0,0 +1,46 @@
+from cache import MISSING, Cache, LocalSharedCache, LRUCache
+
+
+def worker(shared):
+    # One process's cache: its own LRU in front of the shared backend.
+    return Cache(shared=shared, local=LRUCache(maxsize=16, ttl=30))
+
+
+def test_testing_profile_uses_local_shared_cache():
+    from app import cache
+
+    assert isinstance(cache.shared, LocalSharedCache)
+
+
+def test_entries_are_shared_between_workers():
+    shared = LocalSharedCache()
+    first, second = worker(shared), worker(shared)
+    assert first.get_or_set('venue:1', lambda: 'loaded') == 'loaded'
+    assert second.get_or_set('venue:1', lambda: 'reloaded') == 'loaded'
+    assert (first.misses, second.hits) == (1, 1)
+
+
+def test_delete_reaches_the_shared_backend():
+    shared = LocalSharedCache()
+    first, second = worker(shared), worker(shared)
+    first.get_or_set('venue:1', lambda: 'old')
+    second.delete('venue:1')
+    assert shared.get('venue:1') is MISSING
+    assert worker(shared).get_or_set('venue:1', lambda: 'new') == 'new'
+
+
+def test_bump_changes_the_generation_for_every_worker():
+    shared = LocalSharedCache()
+    first, second = worker(shared), worker(shared)
+    token = first.generation('shows')
+    assert second.generation('shows') == token
+    first.bump('shows')
+    # The other worker's LRU keeps the old token until it expires.
+    second.local.clear()
+    assert second.generation('shows') != token
+
+
+def test_missing_rows_are_not_cached():
+    cache = worker(LocalSharedCache())
+    assert cache.get_or_set('venue:404', lambda: None) is None
+    assert cache.get_or_set('venue:404', lambda: 'created') == 'created'
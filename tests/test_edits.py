@@ -0,0 +1,53 @@
+import pytest
+from sqlalchemy import event
+
+from app import app
+from models import db, Venue
+
+FORM = {
+    'name': 'The Musical Hop',
+    'city': 'San Francisco',
+    'state': 'CA',
+    'address': '1015 Folsom Street',
+    'phone': '123-123-1234',
+    'genres': ['Jazz', 'Folk'],
+    'facebook_link': 'https://www.facebook.com/TheMusicalHop',
+    'image_link': '',
+    'website_link': '',
+    'seeking_description': '',
+}
+
+
+@pytest.fixture
+def updates():
+    with app.app_context():
+        db.create_all()
+        db.session.add(Venue(seeking_talent=False, **FORM))
+        db.session.commit()
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context,
+                   executemany):
+            if statement.startswith('UPDATE venues'):
+                statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        yield statements
+        event.remove(db.engine, 'before_cursor_execute', record)
+        db.session.remove()
+        db.drop_all()
+
+
+def test_edit_writes_only_the_changed_columns(updates):
+    response = app.test_client().post(
+        '/venues/1/edit', data=dict(FORM, name='The Musical Hopper'))
+    assert response.status_code == 302
+    [statement] = updates
+    assert statement.split(' WHERE ')[0] == \
+        'UPDATE venues SET name=?, version=(venues.version + ?)'
+
+
+def test_unchanged_edit_writes_nothing(updates):
+    response = app.test_client().post('/venues/1/edit', data=FORM)
+    assert response.status_code == 302
+    assert updates == []
@@ -0,0 +1,49 @@
+import base64
+
+import pytest
+from flask import Flask
+
+from config import TestingConfig
+from images import FetchError, ImageProxy, LocalFetcher, UrlFetcher
+
+# A real 1x1 PNG, so the thumbnail renders when Pillow is installed.
+PIXEL = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA'
+    '60e6kgAAAABJRU5ErkJggg==')
+
+
+@pytest.fixture
+def proxy(tmp_path):
+    sources = tmp_path / 'sources'
+    sources.mkdir()
+    (sources / 'band.png').write_bytes(PIXEL)
+    app = Flask(__name__)
+    app.config.from_object(TestingConfig)
+    app.config.update(IMAGE_CACHE_DIR=str(tmp_path / 'cache'),
+                      IMAGE_LOCAL_DIR=str(sources))
+    proxy = ImageProxy(app, fetcher=LocalFetcher(str(sources)))
+    yield proxy
+    proxy.executor.shutdown()
+
+
+@pytest.mark.parametrize('url', [
+    'http://127.0.0.1/band.png',
+    'http://localhost/band.png',
+    'http://169.254.169.254/latest/meta-data/',
+    'http://[::1]/band.png',
+])
+def test_fetcher_refuses_non_public_hosts(url):
+    with pytest.raises(FetchError, match='non-public'):
+        UrlFetcher()(url)
+
+
+def test_cached_image_is_served_without_the_worker_pool(proxy, monkeypatch):
+    source = 'https://example.com/band.png'
+    path = proxy.thumbnail(source, 'tile')
+
+    def submit(*args):
+        raise AssertionError('cache hit went to the worker pool')
+
+    monkeypatch.setattr(proxy.executor, 'submit', submit)
+    assert proxy.thumbnail(source, 'tile') == path
+    assert proxy.fetcher.fetched == [source]
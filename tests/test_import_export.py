@@ -0,0 +1,83 @@
+from datetime import datetime
+
+import pytest
+
+from app import app, search_engine
+from exporter import export
+from importer import import_rows, read_rows
+from models import db, Venue, Artist, Show
+
+CONTACT = {'phone': '555-555-5555',
+           'facebook_link': 'https://www.facebook.com/fyyur'}
+
+
+@pytest.fixture
+def session():
+    with app.app_context():
+        db.create_all()
+        yield db.session
+        db.session.remove()
+        db.drop_all()
+
+
+def add_rows(session):
+    session.add_all([
+        Venue(name='The Musical Hop', city='San Francisco', state='CA',
+              address='1015 Folsom Street', genres=['Jazz', 'Folk'],
+              seeking_talent=True, **CONTACT),
+        Artist(name='Guns N Petals', city='San Francisco', state='CA',
+               genres=['Rock_And_Roll'], seeking_venue=False, **CONTACT),
+    ])
+    session.flush()
+    session.add_all([
+        Show(venue_id=1, artist_id=1, start_time=datetime(2035, 4, 1, 20),
+             end_time=datetime(2035, 4, 1, 22)),
+        Show(venue_id=1, artist_id=1,
+             start_time=datetime(2035, 4, 2, 20, 30, 15, 500),
+             end_time=datetime(2035, 4, 2, 23)),
+    ])
+    session.commit()
+
+
+def snapshot(session):
+    return (
+        session.query(Venue.name, Venue.genres, Venue.seeking_talent)
+        .order_by(Venue.id).all(),
+        session.query(Artist.name, Artist.genres, Artist.seeking_venue)
+        .order_by(Artist.id).all(),
+        session.query(Show.venue_id, Show.artist_id, Show.start_time,
+                      Show.end_time).order_by(Show.id).all(),
+    )
+
+
+@pytest.mark.parametrize('format', ['csv', 'ndjson'])
+def test_exports_import_back(session, tmp_path, format):
+    add_rows(session)
+    before = snapshot(session)
+    paths = {}
+    for kind in ('venues', 'artists', 'shows'):
+        paths[kind] = tmp_path / f'{kind}.{format}'
+        paths[kind].write_text(''.join(export(session, kind, format)))
+
+    db.drop_all()
+    db.create_all()
+    for kind in ('venues', 'artists', 'shows'):
+        report = import_rows(session, kind, read_rows(str(paths[kind])))
+        assert (report.loaded, report.rejected) == (2 if kind == 'shows'
+                                                    else 1, 0)
+    assert snapshot(session) == before
+
+
+def test_import_command_refreshes_the_search_index(session, tmp_path):
+    add_rows(session)
+    assert search_engine.search(Venue, 'pianos') == []
+    path = tmp_path / 'venues.csv'
+    path.write_text(
+        'name,city,state,address,phone,genres,facebook_link\n'
+        'The Dueling Pianos Bar,New York,NY,335 Delancey Street,'
+        '555-555-5555,Classical,https://www.facebook.com/pianos\n')
+    result = app.test_cli_runner().invoke(args=['import', 'venues',
+                                                str(path)])
+    assert result.exit_code == 0, result.output
+    assert [venue.name for venue in search_engine.search(Venue, 'pianos')] \
+        == ['The Dueling Pianos Bar']
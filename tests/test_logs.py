@@ -0,0 +1,21 @@
+import logging
+
+from logs import SizedTimedRotatingFileHandler
+
+
+def test_size_rollovers_within_a_day_keep_every_line(tmp_path):
+    handler = SizedTimedRotatingFileHandler(
+        str(tmp_path / 'error.log'), max_bytes=200, when='midnight')
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger = logging.Logger('test_logs')
+    logger.addHandler(handler)
+    for number in range(40):
+        logger.warning('line %02d of the size rollover test', number)
+    handler.close()
+
+    files = sorted(tmp_path.iterdir())
+    assert len(files) > 2
+    lines = sorted(line for path in files
+                   for line in path.read_text().splitlines())
+    assert lines == [f'line {number:02d} of the size rollover test'
+                     for number in range(40)]
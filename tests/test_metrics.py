@@ -0,0 +1,22 @@
+import pytest
+
+from app import app, metrics
+from models import db
+
+
+@pytest.fixture
+def client():
+    with app.app_context():
+        db.create_all()
+    yield app.test_client()
+    with app.app_context():
+        db.drop_all()
+
+
+def test_streamed_export_statements_are_counted(client):
+    before = metrics.queries['export_data'].sum
+    response = client.get('/export/shows.csv')
+    response.get_data()
+    response.close()
+    assert response.status_code == 200
+    assert metrics.queries['export_data'].sum > before
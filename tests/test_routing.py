@@ -0,0 +1,110 @@
+import os
+
+import pytest
+from flask import Flask, request
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, text
+
+from routing import STICKY_COOKIE, RoutingSession, configure_replicas, \
+    init_replicas
+
+
+def make_database(path, name):
+    # Each database holds one row naming it, so a read shows where it ran.
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as connection:
+        connection.execute(text('CREATE TABLE items '
+                                '(id INTEGER PRIMARY KEY, name TEXT)'))
+        connection.execute(text('INSERT INTO items (name) VALUES (:name)'),
+                           {'name': name})
+    engine.dispose()
+
+
+def names(path):
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.connect() as connection:
+        rows = connection.execute(text('SELECT name FROM items ORDER BY id'))
+        result = [name for name, in rows]
+    engine.dispose()
+    return result
+
+
+@pytest.fixture
+def databases(tmp_path):
+    primary, replica = tmp_path / 'primary.db', tmp_path / 'replica.db'
+    make_database(primary, 'primary')
+    make_database(replica, 'replica')
+    return primary, replica
+
+
+@pytest.fixture
+def app(databases):
+    primary, replica = databases
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{primary}',
+        SQLALCHEMY_REPLICA_URIS=[f'sqlite:///{replica}'],
+        REPLICA_STICKY_SECONDS=5,
+        REPLICA_CHECK_INTERVAL=0,
+        REPLICA_MAX_LAG_SECONDS=5,
+    )
+    db = SQLAlchemy(session_options={'class_': RoutingSession})
+    configure_replicas(app)
+    db.init_app(app)
+    init_replicas(app, db)
+
+    @app.route('/items', methods=['GET', 'POST'])
+    def items():
+        if request.method == 'POST':
+            db.session.execute(text('INSERT INTO items (name) '
+                                    'VALUES (:name)'),
+                               {'name': request.form['name']})
+            db.session.commit()
+            return '', 201
+        return {'names': db.session.execute(text(
+            'SELECT name FROM items ORDER BY id')).scalars().all()}
+
+    yield app
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def test_get_reads_from_the_replica(app):
+    response = app.test_client().get('/items')
+    assert response.json['names'] == ['replica']
+
+
+def test_writes_go_to_the_primary_and_stick(app, databases):
+    primary, replica = databases
+    client = app.test_client()
+    response = client.post('/items', data={'name': 'added'})
+    assert response.status_code == 201
+    assert names(primary) == ['primary', 'added']
+    assert names(replica) == ['replica']
+    assert STICKY_COOKIE in response.headers.get('Set-Cookie', '')
+
+    # The writer reads its own write; other clients still use the replica.
+    assert client.get('/items').json['names'] == ['primary', 'added']
+    assert app.test_client().get('/items').json['names'] == ['replica']
+
+
+def test_unreachable_replica_falls_back_to_the_primary(app, databases):
+    primary, replica = databases
+    os.remove(replica)
+    os.mkdir(replica)  # a directory cannot be opened as a database
+    response = app.test_client().get('/items')
+    assert response.json['names'] == ['primary']
+    assert app.extensions['replicas'].healthy_count() == 0
+
+
+def test_replica_is_used_again_once_it_recovers(app, databases):
+    primary, replica = databases
+    os.rename(replica, str(replica) + '.away')
+    os.mkdir(replica)
+    client = app.test_client()
+    assert client.get('/items').json['names'] == ['primary']
+    os.rmdir(replica)
+    os.rename(str(replica) + '.away', replica)
+    assert client.get('/items').json['names'] == ['replica']
+    assert app.extensions['replicas'].healthy_count() == 1
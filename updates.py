@@ -0,0 +1,106 @@
+"""Partial updates of venues and artists with optimistic concurrency.
+
+Each change is a single ``UPDATE ... WHERE id = :id AND version = :version``
+that sets only the given columns and bumps the version, so the row is not
+read first and an edit made against an outdated version is refused instead
+of silently overwriting the newer one.
+"""
+from sqlalchemy import select, update
+from werkzeug.datastructures import MultiDict
+
+from forms import VenueForm, ArtistForm, validate_fields
+from models import Venue, Artist
+
+FORMS = {Venue: VenueForm, Artist: ArtistForm}
+
+
+class InvalidChanges(ValueError):
+    def __init__(self, errors):
+        super().__init__('Invalid changes')
+        self.errors = errors
+
+
+class VersionConflict(Exception):
+    # version is None when the row does not exist.
+
+    def __init__(self, entity_id, version):
+        super().__init__(f'Row {entity_id} is at version {version}')
+        self.entity_id = entity_id
+        self.version = version
+
+
+def _formdata(changes):
+    # JSON values in the shape the forms parse from a posted HTML form.
+    formdata = MultiDict()
+    for name, value in changes.items():
+        if isinstance(value, list):
+            for item in value:
+                formdata.add(name, item)
+        elif isinstance(value, bool):
+            formdata.add(name, 'y' if value else 'false')
+        elif isinstance(value, dict):
+            raise InvalidChanges({name: ['Expected a single value.']})
+        else:
+            formdata.add(name, '' if value is None else str(value))
+    return formdata
+
+
+def clean_changes(model, changes):
+    """Validate a JSON object of changes with the model's form; returns the
+    column values to set."""
+    if not isinstance(changes, dict) or not changes:
+        raise InvalidChanges({'changes': ['Expected a non-empty object.']})
+    form = FORMS[model](formdata=_formdata(changes), meta={'csrf': False})
+    unknown = sorted(set(changes) - set(form._fields))
+    if unknown:
+        raise InvalidChanges({name: ['Unknown field.'] for name in unknown})
+    if not validate_fields(form, changes):
+        raise InvalidChanges({name: form[name].errors for name in changes
+                              if form[name].errors})
+    return {name: form[name].data for name in changes}
+
+
+def changed_values(session, model, entity_id, values):
+    """The entries of ``values`` that differ from the row's current
+    columns, as a full form submits every field; None when the row does not
+    exist."""
+    table = model.__table__
+    row = session.execute(select(*(table.c[name] for name in values))
+                          .where(table.c.id == entity_id)).first()
+    if row is None:
+        return None
+    return {name: value for name, value in values.items()
+            if not _same(row._mapping[name], value)}
+
+
+def _same(current, value):
+    # Genres are a set: SQLite returns them in enums.Genre order.
+    if isinstance(current, list) and isinstance(value, list):
+        return sorted(current) == sorted(value)
+    return current == value
+
+
+def apply_updates(session, model, updates):
+    """Apply ``(id, version, values)`` updates without committing.
+
+    Returns the new versions by id and a ``VersionConflict`` for each
+    update whose row was missing or at another version; the caller should
+    roll back when there are any. A version of None skips the check.
+    """
+    table = model.__table__
+    versions = {}
+    conflicts = []
+    for entity_id, version, values in updates:
+        criteria = [table.c.id == entity_id]
+        if version is not None:
+            criteria.append(table.c.version == version)
+        new_version = session.execute(
+            update(table).where(*criteria)
+            .values({**values, 'version': table.c.version + 1})
+            .returning(table.c.version)).scalar()
+        if new_version is None:
+            conflicts.append(VersionConflict(entity_id, session.scalar(
+                select(table.c.version).where(table.c.id == entity_id))))
+        else:
+            versions[entity_id] = new_version
+    return versions, conflicts